@@ -51,11 +51,14 @@ INSTALLED_APPS = [
 CITIES_LIGHT_INCLUDE_COUNTRIES = ['TR']
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'store.staticfiles.PreloadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,7 +67,8 @@ ROOT_URLCONF = 'K1001Shop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render times to the metrics middleware.
+        'BACKEND': 'store.metrics.TimedDjangoTemplates',
         'DIRS': [ os.path.join(BASE_DIR, 'templates') ],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,12 +137,31 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
-STATIC_ROOT = ''
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = ( os.path.join('static'), )
 
+# collectstatic writes content-hashed names, a manifest and .gz/.br copies to
+# STATIC_ROOT, see store.staticfiles.
+STATICFILES_STORAGE = 'store.staticfiles.CompressedManifestStaticFilesStorage'
+
+# With DEBUG off the app serves STATIC_ROOT itself, hashed names for
+# STATIC_MAX_AGE seconds. Turn it off when the web server serves STATIC_ROOT.
+SERVE_STATIC = True
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
+# Sent as Link: rel=preload headers on every HTML page.
+PRELOAD_ASSETS = (
+    ('css/bootstrap.min.css', 'style'),
+    ('css/mdb.min.css', 'style'),
+    ('css/style.min.css', 'style'),
+    ('js/jquery-3.4.1.min.js', 'script'),
+    ('js/bootstrap.min.js', 'script'),
+    ('js/mdb.min.js', 'script'),
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -156,6 +179,87 @@ MEDIA_ROOT = os.path.join('media')
 
 MEDIA_URL = '/media/'
 
+# Resized variants of uploaded images, written under MEDIA_ROOT/IMAGE_DERIVATIVE_DIR
+# on upload and by the generate_image_derivatives command, see store.images.
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_WIDTHS = (160, 320, 640, 960, 1280)
+IMAGE_FORMATS = ('jpeg', 'webp')
+IMAGE_QUALITY = 80
+
+# Product search, use 'store.search.MySQLFullTextBackend' to search with
+# the FULLTEXT indexes instead of the in-process index.
+SEARCH_BACKEND = 'store.search.InvertedIndexBackend'
+
+# Numbered pages need a COUNT and an OFFSET per listing page, cursor links do not.
+LISTING_PAGE_NUMBERS = False
+
+# The catalog version, rendered pages, the search index version and cached
+# carts have to be seen by every worker process. Point CACHE_LOCATION at
+# memcached (host:port). Without it each process keeps its own LocMemCache,
+# which with DEBUG off is refused at startup unless SINGLE_PROCESS is set.
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+SINGLE_PROCESS = False
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_LOCATION,
+    } if CACHE_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Rendered listing pages and product cards are keyed by a catalog version
+# that product, category and review changes bump, the timeout only frees memory.
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Product and listing pages carry an ETag, anonymous ones also Last-Modified.
+# Anonymous pages are public for PAGE_MAX_AGE seconds (Vary: Cookie), after
+# which browsers and proxies revalidate them.
+PAGE_MAX_AGE = 0
+
+# Best rated products shown per category, and the reviews a product needs
+# before it can be listed.
+LEADERBOARD_SIZE = 4
+LEADERBOARD_MIN_REVIEWS = 0
+
+# Adding to cart holds the quantity for RESERVATION_TTL seconds. Run the
+# release_reservations command so expired holds go back on sale.
+STOCK_RESERVATIONS = False
+RESERVATION_TTL = 15 * 60
+
+# 'store.cart.CacheCartStore' keeps open carts in the cache and writes them to
+# the database at checkout, or for carts idle longer than `flush_carts
+# --older-than` when that command is scheduled.
+CART_STORE = 'store.cart.DatabaseCartStore'
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Requests slower than METRICS_SLOW_REQUEST seconds are logged with their SQL,
+# sampled at METRICS_SLOW_SAMPLE_RATE. Besides staff, /metrics/ accepts
+# 'Authorization: Bearer <METRICS_TOKEN>' from a scraper when a token is set.
+METRICS_SLOW_REQUEST = 1.0
+METRICS_SLOW_SAMPLE_RATE = 0.1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Staff can profile a request with ?profile=cprofile or ?profile=sample (or an
+# X-Profile header), PROFILE_SAMPLE_RATE samples random requests. The newest
+# PROFILE_KEEP files are kept and listed at /admin/profiles/.
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_SAMPLE_RATE = 0
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_KEEP = 100
+
+# Serve the AJAX review and subregion endpoints with async views. Only worth
+# it under ASGI (see README), their queries run on a pool of ASYNC_DB_THREADS
+# threads, which also caps the database connections they hold.
+ASYNC_AJAX = False
+ASYNC_DB_THREADS = 8
+
+# JSON API under /api/v1/. Catalog responses carry an ETag and Last-Modified
+# and are public for API_MAX_AGE seconds, after which clients and CDNs
+# revalidate them and get a 304 while the catalog is unchanged.
+API_PAGE_SIZE = 24
+API_MAX_AGE = 0
+
 MESSAGE_TAGS = {
     messages.DEBUG: 'alert-info',
     messages.INFO: 'alert-info',
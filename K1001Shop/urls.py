@@ -14,7 +14,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path, reverse_lazy
-from store import views
+from store import api, staticfiles, views
 
 from django.contrib import admin
 
@@ -26,6 +26,8 @@ from django.conf.urls.static import static
 from accounts import views as accounts_views
 
 urlpatterns = [
+    path('admin/profiles/', views.ProfilesView.as_view(), name='profiles'),
+    path('admin/profiles/<str:name>', views.ProfileDownloadView.as_view(), name='profile_download'),
     path('admin/', admin.site.urls),
     path('',views.HomeView.as_view(), name='home'),
     path('contact/',views.ContactView.as_view(), name='contact'),
@@ -57,14 +59,26 @@ urlpatterns = [
     path('settings/account/change/', accounts_views.SettingsChangeView.as_view(), name='change_settings'),
     path('addresses/add', views.AddAddressView.as_view(), name='add_address'),
     path('addresses/remove/<int:id>/', views.DeleteAddressView.as_view(), name='delete_address'),
-    path('ajax/load-subregions/', views.LoadSubregionsView.as_view() , name='ajax_load_subregions'),
-    path('ajax/reviews/', views.AjaxReviewsView.as_view(), name='ajax_reviews'),
+    path('ajax/load-subregions/', views.load_subregions if settings.ASYNC_AJAX else views.LoadSubregionsView.as_view(), name='ajax_load_subregions'),
+    path('ajax/reviews/', views.ajax_reviews if settings.ASYNC_AJAX else views.AjaxReviewsView.as_view(), name='ajax_reviews'),
     path('cart/', views.CartView.as_view(), name='cart'),
     path('checkout/', views.CheckoutView.as_view(), name='checkout'),
     path('orders/', views.OrdersView.as_view(), name='orders'),
     path('orders/refund/<int:pk>/', views.RefundView.as_view(), name='refund'),
     path('wallet/', views.BalanceView.as_view(), name='wallet'),
     path('cards/add/', views.AddCardView.as_view(), name='addcard'),
+    path('stats/cache/', views.CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('api/v1/products/', api.ProductListAPIView.as_view(), name='api_products'),
+    path('api/v1/products/<slug:slug>/', api.ProductAPIView.as_view(), name='api_product'),
+    path('api/v1/products/<slug:slug>/reviews/', api.ReviewListAPIView.as_view(), name='api_reviews'),
+    path('api/v1/cart/', api.CartAPIView.as_view(), name='api_cart'),
     path('<slug:slug>/', views.HomeView.as_view(), name='category_home' ), # Problem in here
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
+# Under DEBUG runserver serves the app directories itself.
+if settings.SERVE_STATIC and not settings.DEBUG:
+    urlpatterns += [
+        path(settings.STATIC_URL.lstrip('/') + '<path:path>', staticfiles.serve),
+    ]
+
@@ -11,7 +11,6 @@ from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponseRedirect
 
 
@@ -21,7 +20,8 @@ import sys
 sys.path.append('../store')
   
 # importing
-from store.models import Order, Balance, Address, Card
+from store.models import Balance, Address, Card
+from store.cart import get_cart_store
 
 # TODO Add Login Required Mixins
 
@@ -29,12 +29,7 @@ from store.models import Order, Balance, Address, Card
 class CustomLoginView(LoginView):
     def form_valid(self, form):
         auth_login(self.request, form.get_user())
-        try:
-            order = Order.objects.get(user=form.get_user(), ordered=False)
-            self.request.session['items_total'] = order.items.count()
-        except ObjectDoesNotExist:
-            order = None
-            self.request.session['items_total'] = 0
+        self.request.session['items_total'] = get_cart_store().count(form.get_user())
 
         wallet = Balance.objects.get(user=form.get_user())
         self.request.session['balance'] = str(wallet.balance)
@@ -76,7 +71,7 @@ class SettingsChangeView(LoginRequiredMixin, View):
 class AccountView(LoginRequiredMixin, View):
     def get(self, request):
         user = request.user
-        addresses = Address.objects.filter(user=user)
+        addresses = Address.objects.filter(user=user).select_related('region', 'subregion')
         cards = Card.objects.filter(user=user)
         context = {
             'user': user,
@@ -1,5 +1,9 @@
+import decimal
+from django import forms
 from django.contrib import admin
-from .models import Address, CartProduct, Product, Category, Order, Review, Refund, Balance, Card
+from django.shortcuts import render
+from . import wallet
+from .models import Address, CartProduct, Product, Category, Order, Review, Refund, Balance, Card, Recommendation, PurchasedProduct, LeaderboardEntry, Reservation, LedgerEntry, BalanceSnapshot
 # Register your models here.
 
 
@@ -9,6 +13,62 @@ admin.site.register(CartProduct)
 admin.site.register(Order)
 admin.site.register(Address)
 admin.site.register(Review)
-admin.site.register(Balance)
 admin.site.register(Refund)
 admin.site.register(Card)
+admin.site.register(Recommendation)
+admin.site.register(PurchasedProduct)
+admin.site.register(LeaderboardEntry)
+admin.site.register(Reservation)
+admin.site.register(BalanceSnapshot)
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    # Entries are append-only, wallet.post writes them with the balance change.
+    list_display = ('id', 'user', 'kind', 'amount', 'order', 'created_at')
+    list_filter = ('kind',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class TopUpForm(forms.Form):
+    amount = forms.DecimalField(max_digits=10, decimal_places=2, min_value=decimal.Decimal('0.01'))
+
+
+@admin.register(Balance)
+class BalanceAdmin(admin.ModelAdmin):
+    # Balances only change together with a ledger entry, see wallet.post.
+    list_display = ('user', 'balance')
+    search_fields = ('user__username',)
+    actions = ('top_up',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_top_up_permission(self, request):
+        return request.user.has_perm('store.change_balance')
+
+    @admin.action(description='Top up selected wallets', permissions=('top_up',))
+    def top_up(self, request, queryset):
+        form = TopUpForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            for user_id in queryset.values_list('user_id', flat=True):
+                wallet.top_up(user_id, form.cleaned_data['amount'])
+            self.message_user(request, f'Topped up {queryset.count()} wallets by {form.cleaned_data["amount"]}.')
+            return None
+        return render(request, 'admin/wallet_top_up.html', {
+            **self.admin_site.each_context(request), 'form': form, 'balances': queryset.select_related('user'),
+        })
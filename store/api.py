@@ -0,0 +1,145 @@
+import hashlib
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import View
+from .caching import get_catalog_modified, get_catalog_version
+from .cart import get_cart_store
+from .models import Product, Recommendation, Review
+from .pagination import cursor_paginate
+
+API_VERSION = 'v1'
+
+# Catalog data only. Stock changes on every checkout without a catalog
+# change, so live availability is part of the cart summary instead.
+PRODUCT_FIELDS = (
+    'id', 'name', 'slug', 'price', 'discount_price', 'image',
+    'rating_average', 'rating_count', 'category__slug', 'date_added',
+)
+REVIEW_FIELDS = ('id', 'user__first_name', 'subject', 'comment', 'rating', 'updated_at')
+
+
+def catalog_etag(request, *args, **kwargs):
+    # Product, category and review writes bump the catalog version, so one
+    # number covers every catalog response.
+    return f'{API_VERSION}-{get_catalog_version()}'
+
+
+def catalog_modified(request, *args, **kwargs):
+    return get_catalog_modified()
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder,
+                        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def product_row(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'slug': row['slug'],
+        'price': row['price'],
+        'discount_price': row['discount_price'],
+        'image': default_storage.url(row['image']),
+        'rating': round(row['rating_average'], 1),
+        'rating_count': row['rating_count'],
+        'category': row['category__slug'],
+        'date_added': row['date_added'],
+    }
+
+
+def review_row(row):
+    return {
+        'id': row['id'],
+        'user': row['user__first_name'],
+        'subject': row['subject'],
+        'comment': row['comment'],
+        'rating': row['rating'],
+        'updated_at': row['updated_at'],
+    }
+
+
+def page_data(page, serialize):
+    return {
+        'results': [serialize(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+class CatalogAPIView(View):
+    # Revalidated on every use, a 304 costs no queries beyond the cache.
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        patch_cache_control(response, public=True, max_age=settings.API_MAX_AGE)
+        return response
+
+
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_modified), name='get')
+class ProductListAPIView(CatalogAPIView):
+    def get(self, request):
+        products = Product.objects.all()
+        category = request.GET.get('category')
+        if category:
+            products = products.filter(category__slug=category)
+        page = cursor_paginate(products.values(*PRODUCT_FIELDS), ('date_added', 'id'),
+                               request.GET.get('cursor'), settings.API_PAGE_SIZE)
+        return json_response(page_data(page, product_row))
+
+
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_modified), name='get')
+class ProductAPIView(CatalogAPIView):
+    def get(self, request, slug):
+        row = Product.objects.filter(slug=slug).values(*PRODUCT_FIELDS, 'description', 'category__title',
+                                                       'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5').first()
+        if row is None:
+            raise Http404()
+        recommended = Recommendation.objects.filter(product_id=row['id']).order_by('rank').values(
+            *[f'recommended__{field}' for field in PRODUCT_FIELDS])
+        data = product_row(row)
+        data.update({
+            'description': row['description'],
+            'category_title': row['category__title'],
+            'rating_histogram': {stars: row[f'stars_{stars}'] for stars in range(1, 6)},
+            'recommendations': [
+                product_row({field: rec[f'recommended__{field}'] for field in PRODUCT_FIELDS}) for rec in recommended
+            ],
+        })
+        return json_response(data)
+
+
+@method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_modified), name='get')
+class ReviewListAPIView(CatalogAPIView):
+    def get(self, request, slug):
+        reviews = Review.objects.filter(product__slug=slug).exclude(comment='').values(*REVIEW_FIELDS)
+        page = cursor_paginate(reviews, ('updated_at', 'id'), request.GET.get('cursor'), settings.API_PAGE_SIZE)
+        return json_response(page_data(page, review_row))
+
+
+class CartAPIView(View):
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return json_response({'detail': 'Authentication required.'}, status=401)
+        cart = get_cart_store().get_cart(request.user)
+        response = json_response({
+            'lines': [{
+                'product': line.item.slug,
+                'name': line.item.name,
+                'quantity': line.quantity,
+                'unit_price': line.get_unit_price(),
+                'total_price': line.get_final_price(),
+                'available': line.item.available,
+            } for line in cart],
+            'count': cart.count(),
+            'total': cart.get_total(),
+        })
+        # Per user and built from live rows, so the tag is a hash of the body.
+        response['ETag'] = f'"{API_VERSION}-{hashlib.md5(response.content).hexdigest()}"'
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return get_conditional_response(request, etag=response['ETag'], response=response)
@@ -0,0 +1,113 @@
+from collections import Counter, defaultdict
+from itertools import combinations
+from django.db import transaction
+from .caching import bump_catalog_version
+from .models import AssociationRun, Cooccurrence, Order, Recommendation
+
+
+def get_baskets(incremental=False):
+    # One basket per checked out order, as a set of product ids. Incremental
+    # runs take the orders no run has counted yet, whenever they committed.
+    orders = Order.objects.filter(ordered=True)
+    if incremental:
+        orders = orders.filter(mined=False)
+
+    rows = Order.items.through.objects.filter(order__in=orders).values_list('order_id', 'cartproduct__item_id')
+
+    baskets = defaultdict(set)
+    for order_id, product_id in rows.iterator():
+        baskets[order_id].add(product_id)
+    return baskets
+
+
+def count_pairs(baskets):
+    counts = Counter()
+    for basket in baskets:
+        for product_id in basket:
+            counts[(product_id, product_id)] += 1
+        for a, b in combinations(sorted(basket), 2):
+            counts[(a, b)] += 1
+            counts[(b, a)] += 1
+    return counts
+
+
+def save_counts(counts, incremental):
+    if not incremental:
+        Cooccurrence.objects.all().delete()
+        Cooccurrence.objects.bulk_create(
+            [Cooccurrence(product_id=a, other_id=b, baskets=n) for (a, b), n in counts.items()],
+            batch_size=1000)
+        return
+
+    existing = {
+        (c.product_id, c.other_id): c
+        for c in Cooccurrence.objects.filter(product_id__in={a for a, _ in counts})
+    }
+    changed = []
+    created = []
+    for key, n in counts.items():
+        if key in existing:
+            existing[key].baskets += n
+            changed.append(existing[key])
+        else:
+            created.append(Cooccurrence(product_id=key[0], other_id=key[1], baskets=n))
+    Cooccurrence.objects.bulk_update(changed, ['baskets'], batch_size=1000)
+    Cooccurrence.objects.bulk_create(created, batch_size=1000)
+
+
+def rule_rank(support, confidence, lift, product_id):
+    # Rules are ranked by support like the apriori filter in
+    # mba.get_associated(), then confidence and lift, ties go to the lower
+    # product id. CooccurrenceEngine.top_k ranks the same way.
+    return -support, -confidence, -lift, product_id
+
+
+def build_recommendations(total, top_k=4, min_support=0.0, min_lift=1.0):
+    # Rules are single product -> single product.
+    baskets = {}
+    pairs = defaultdict(list)
+    for a, b, n in Cooccurrence.objects.values_list('product_id', 'other_id', 'baskets').iterator():
+        if a == b:
+            baskets[a] = n
+        else:
+            pairs[a].append((b, n))
+
+    recommendations = []
+    for product_id, others in pairs.items():
+        rules = []
+        for other_id, n in others:
+            support = n / total
+            confidence = n / baskets[product_id]
+            lift = confidence / (baskets[other_id] / total)
+            if support >= min_support and lift >= min_lift:
+                rules.append((support, confidence, lift, other_id))
+        rules.sort(key=lambda rule: rule_rank(*rule))
+        for rank, (support, confidence, lift, other_id) in enumerate(rules[:top_k]):
+            recommendations.append(Recommendation(
+                product_id=product_id, recommended_id=other_id, rank=rank,
+                support=support, confidence=confidence, lift=lift))
+
+    Recommendation.objects.all().delete()
+    Recommendation.objects.bulk_create(recommendations, batch_size=1000)
+    return len(recommendations)
+
+
+def mine_associations(incremental=False, top_k=4, min_support=0.0, min_lift=1.0):
+    last_run = AssociationRun.objects.order_by('-finished_at').first() if incremental else None
+    if last_run is None:
+        incremental = False
+
+    baskets = get_baskets(incremental)
+    total = len(baskets) + (last_run.baskets if incremental else 0)
+
+    with transaction.atomic():
+        save_counts(count_pairs(baskets.values()), incremental)
+        order_ids = list(baskets)
+        for start in range(0, len(order_ids), 1000):
+            Order.objects.filter(id__in=order_ids[start:start + 1000]).update(mined=True)
+        created = build_recommendations(total, top_k, min_support, min_lift) if total else 0
+        AssociationRun.objects.create(baskets=total)
+        # Product pages and their validators show the recommendations.
+        transaction.on_commit(bump_catalog_version)
+
+    return len(baskets), created
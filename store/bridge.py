@@ -0,0 +1,33 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.ASYNC_DB_THREADS, thread_name_prefix='db')
+    return _executor
+
+
+def call(func, *args):
+    # Pool threads keep their connection between calls, so they get the same
+    # CONN_MAX_AGE handling Django gives request threads.
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args):
+    # Runs blocking ORM code for async views on a bounded pool. A burst of
+    # requests queues for a thread instead of opening a connection each.
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, call, func, *args))
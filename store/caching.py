@@ -0,0 +1,132 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+STATS_KEY = 'cache_stats:{}:{}'
+STATS_SECTIONS = ('listing', 'card')
+# Session values templates/includes/navbar.html renders on every page.
+NAVBAR_SESSION_KEYS = ('items_total', 'balance')
+
+
+def check_shared_cache():
+    # A version bump in one worker has to reach the others, or they keep
+    # serving stale pages and disagree on ETags until the entries expire.
+    if settings.DEBUG or settings.SINGLE_PROCESS:
+        return
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            'The default cache is local to each process. Set CACHE_LOCATION to a shared '
+            'memcached, or SINGLE_PROCESS = True when the site runs in one process.')
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted version never reuses old keys.
+        cache.add(CATALOG_VERSION_KEY, int(time.time()), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def get_catalog_modified():
+    # Last-Modified of anything rendered from the catalog. Unknown after an
+    # eviction, which then counts as a change now.
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        cache.add(CATALOG_MODIFIED_KEY, modified, None)
+    return datetime.fromtimestamp(modified, timezone.utc)
+
+
+def count(section, outcome):
+    key = STATS_KEY.format(section, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    keys = [STATS_KEY.format(s, o) for s in STATS_SECTIONS for o in ('hit', 'miss')]
+    values = cache.get_many(keys)
+    stats = {}
+    for section in STATS_SECTIONS:
+        hits = values.get(STATS_KEY.format(section, 'hit'), 0)
+        misses = values.get(STATS_KEY.format(section, 'miss'), 0)
+        stats[section] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    stats['catalog_version'] = get_catalog_version()
+    return stats
+
+
+def listing_key(version, category_slug, page, query):
+    # Everything but the version comes from the URL, hashed it fits
+    # memcached's key rules.
+    request = hashlib.md5(repr((category_slug or '', page or '', query or '')).encode()).hexdigest()
+    return f'listing:{version}:{request}'
+
+
+def card_key(version, product_id):
+    return f'card:{version}:{product_id}'
+
+
+def get_or_render(section, key, render):
+    value = cache.get(key)
+    if value is None:
+        count(section, 'miss')
+        value = render()
+        cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT)
+    else:
+        count(section, 'hit')
+    return value
+
+
+def page_etag(request, *parts):
+    # Logged in pages also show the user, the navbar's cart badge and wallet
+    # balance, and CSRF tokens.
+    if request.user.is_authenticated:
+        parts += (request.user.pk, request.user.get_username(), request.META.get('CSRF_COOKIE'))
+        parts += tuple(request.session.get(key) for key in NAVBAR_SESSION_KEYS)
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_page(request, etag, last_modified, render):
+    # Answers 304 when the client holds this version of the page. Anonymous
+    # pages are public, so a reverse proxy may keep them. Last-Modified only
+    # covers the catalog, so logged in pages are validated by ETag alone.
+    personal = request.user.is_authenticated
+    timestamp = None if personal or last_modified is None else int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    if personal:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.PAGE_MAX_AGE)
+    # The same URL renders differently once logged in.
+    patch_vary_headers(response, ('Cookie',))
+    return response
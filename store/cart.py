@@ -0,0 +1,285 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import CartProduct, Order, Product
+from .reservations import release, reserve
+
+
+class NotAvailable(Exception):
+    pass
+
+
+class CartBusy(Exception):
+    pass
+
+
+class Cart:
+    # Open cart lines, saved CartProduct rows or unsaved ones built from the cache.
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def count(self):
+        return len(self.lines)
+
+    def get_total(self):
+        return round(sum(line.get_final_price() for line in self.lines), 2)
+
+
+def open_orders(user):
+    return Order.objects.filter(user=user, ordered=False)
+
+
+def cart_lines(user):
+    return CartProduct.objects.filter(user=user, in_cart=True)
+
+
+def shown_lines(user):
+    # The cart page's lines, in the order they were added.
+    return cart_lines(user).select_related('item__category').order_by('id')
+
+
+def open_order(user):
+    # Serializes a user's cart writes so they share one open order.
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('id'))
+    order = open_orders(user).first()
+    if order is None:
+        order = Order.objects.create(user=user, date_ordered=timezone.now())
+    return order
+
+
+def add_line(user, product, quantity, lines):
+    try:
+        with transaction.atomic():
+            line = CartProduct.objects.create(user=user, item=product, quantity=min(quantity, product.stock))
+    except IntegrityError:
+        # Another request created the line meanwhile, or adding would go over
+        # stock, in which case the line is filled up to it.
+        if lines.filter(quantity__lte=product.stock - quantity).update(quantity=F('quantity') + quantity):
+            return False, False
+        lines.update(quantity=product.stock)
+        return False, True
+
+    with transaction.atomic():
+        Order.items.through.objects.create(order=open_order(user), cartproduct=line)
+    return True, quantity > product.stock
+
+
+def upsert_line(user, product, quantity):
+    lines = cart_lines(user).filter(item=product)
+    if lines.filter(quantity__lte=product.stock - quantity).update(quantity=F('quantity') + quantity):
+        return False, False
+    return add_line(user, product, quantity, lines)
+
+
+def add_to_cart(user, product, quantity):
+    # Returns (created, capped). Adding to an existing line is a single
+    # conditional UPDATE, a line that would go over stock is capped at it.
+    if not settings.STOCK_RESERVATIONS:
+        return upsert_line(user, product, quantity)
+
+    with transaction.atomic():
+        result = upsert_line(user, product, quantity)
+        line = cart_lines(user).get(item=product)
+        if not reserve(line, line.quantity):
+            raise NotAvailable()
+    return result
+
+
+class DatabaseCartStore:
+    # Every change is written to CartProduct and Order rows right away.
+
+    def lines(self, user):
+        return cart_lines(user)
+
+    def add(self, user, product, quantity):
+        return add_to_cart(user, product, quantity)
+
+    def set_quantity(self, user, product, quantity):
+        line = self.lines(user).filter(item=product).first()
+        if line is None:
+            return
+        if settings.STOCK_RESERVATIONS and not reserve(line, quantity):
+            raise NotAvailable()
+        self.lines(user).filter(pk=line.pk).update(quantity=quantity)
+
+    def remove(self, user, product):
+        line = self.lines(user).filter(item=product).first()
+        if line is not None:
+            release(line)
+            line.delete()
+
+    def count(self, user):
+        return self.lines(user).count()
+
+    def get_cart(self, user):
+        return Cart(list(shown_lines(user)))
+
+    def get_order(self, user):
+        return open_orders(user).first()
+
+    def clear(self, user):
+        pass
+
+
+class CacheCartStore:
+    # Open carts live in the cache and only become rows at checkout, or when
+    # flush_carts persists carts that have been around for a while.
+    KEY = 'cart:{}'
+    LOCK_KEY = 'cart:{}:lock'
+    # Carts changed since their last flush are appended to a journal, the
+    # flush command reads it from JOURNAL_DONE up to JOURNAL_NEXT.
+    JOURNAL_KEY = 'carts:journal:{}'
+    JOURNAL_NEXT = 'carts:journal:next'
+    JOURNAL_DONE = 'carts:journal:done'
+
+    def __init__(self):
+        if settings.STOCK_RESERVATIONS:
+            raise ImproperlyConfigured('Stock reservations need the DatabaseCartStore.')
+
+    def lock(self, user_id):
+        key = self.LOCK_KEY.format(user_id)
+        for _ in range(100):
+            if cache.add(key, 1, 5):
+                return key
+            time.sleep(0.01)
+        raise CartBusy()
+
+    def load(self, user_id):
+        data = cache.get(self.KEY.format(user_id))
+        if data is None:
+            # Evicted or never cached, fall back to what was flushed last.
+            lines = CartProduct.objects.filter(user=user_id, in_cart=True).values_list('item_id', 'quantity')
+            data = {'lines': dict(lines), 'updated': time.time(), 'dirty': False}
+        return data
+
+    def save(self, user_id, data):
+        data['updated'] = time.time()
+        if not data['dirty']:
+            data['dirty'] = True
+            self.journal(user_id)
+        cache.set(self.KEY.format(user_id), data, settings.CART_CACHE_TIMEOUT)
+
+    def journal(self, user_id):
+        try:
+            slot = cache.incr(self.JOURNAL_NEXT)
+        except ValueError:
+            cache.add(self.JOURNAL_NEXT, 0, None)
+            slot = cache.incr(self.JOURNAL_NEXT)
+        cache.set(self.JOURNAL_KEY.format(slot), user_id, settings.CART_CACHE_TIMEOUT)
+
+    def change(self, user, apply):
+        key = self.lock(user.pk)
+        try:
+            data = self.load(user.pk)
+            result = apply(data['lines'])
+            self.save(user.pk, data)
+        finally:
+            cache.delete(key)
+        return result
+
+    def add(self, user, product, quantity):
+        def apply(lines):
+            created = product.pk not in lines
+            total = lines.get(product.pk, 0) + quantity
+            lines[product.pk] = min(total, product.stock)
+            return created, total > product.stock
+        return self.change(user, apply)
+
+    def set_quantity(self, user, product, quantity):
+        def apply(lines):
+            if product.pk in lines:
+                lines[product.pk] = quantity
+        self.change(user, apply)
+
+    def remove(self, user, product):
+        self.change(user, lambda lines: lines.pop(product.pk, None))
+
+    def count(self, user):
+        return len(self.load(user.pk)['lines'])
+
+    def get_cart(self, user):
+        lines = self.load(user.pk)['lines']
+        products = Product.objects.select_related('category').in_bulk(list(lines))
+        return Cart([CartProduct(user=user, item=products[pid], quantity=quantity)
+                     for pid, quantity in lines.items() if pid in products])
+
+    def materialize(self, user_id, data):
+        # Makes the open CartProduct rows match the cached cart.
+        lines = data['lines']
+        with transaction.atomic():
+            order = open_order(User(pk=user_id))
+            saved = {line.item_id: line for line in CartProduct.objects.filter(user=user_id, in_cart=True)}
+            CartProduct.objects.filter(id__in=[line.id for pid, line in saved.items() if pid not in lines]).delete()
+            changed = [line for pid, line in saved.items() if pid in lines and line.quantity != lines[pid]]
+            for line in changed:
+                line.quantity = lines[line.item_id]
+            CartProduct.objects.bulk_update(changed, ['quantity'])
+            # One insert per new line, MySQL does not return ids from bulk inserts.
+            existing = Product.objects.filter(pk__in=[pid for pid in lines if pid not in saved]).values_list('id', flat=True)
+            created = [CartProduct.objects.create(user_id=user_id, item_id=pid, quantity=lines[pid]) for pid in existing]
+            Order.items.through.objects.bulk_create([
+                Order.items.through(order=order, cartproduct=line) for line in created])
+        return order
+
+    def get_order(self, user):
+        key = self.lock(user.pk)
+        try:
+            data = self.load(user.pk)
+            if not data['lines']:
+                return None
+            order = self.materialize(user.pk, data)
+        finally:
+            cache.delete(key)
+        return order
+
+    def clear(self, user):
+        cache.delete(self.KEY.format(user.pk))
+
+    def flush(self, older_than=0):
+        # Persists journaled carts untouched for `older_than` seconds, younger
+        # ones go back into the journal for the next run.
+        done = cache.get(self.JOURNAL_DONE, 0)
+        last = cache.get(self.JOURNAL_NEXT, 0)
+        flushed = 0
+        for start in range(done + 1, last + 1, 500):
+            keys = [self.JOURNAL_KEY.format(slot) for slot in range(start, min(start + 500, last + 1))]
+            for user_id in set(cache.get_many(keys).values()):
+                key = self.lock(user_id)
+                try:
+                    data = cache.get(self.KEY.format(user_id))
+                    if data is None or not data['dirty']:
+                        continue
+                    if time.time() - data['updated'] < older_than:
+                        self.journal(user_id)
+                        continue
+                    self.materialize(user_id, data)
+                    data['dirty'] = False
+                    cache.set(self.KEY.format(user_id), data, settings.CART_CACHE_TIMEOUT)
+                    flushed += 1
+                finally:
+                    cache.delete(key)
+            cache.delete_many(keys)
+        cache.set(self.JOURNAL_DONE, last, None)
+        return flushed
+
+
+_stores = {}
+
+
+def get_cart_store():
+    path = getattr(settings, 'CART_STORE', 'store.cart.DatabaseCartStore')
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
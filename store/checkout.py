@@ -0,0 +1,79 @@
+import decimal
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+from . import wallet
+from .models import CartProduct, Order, Product, PurchasedProduct, Reservation
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, lines):
+        # Every cart line whose product cannot cover the ordered quantity.
+        self.lines = lines
+        super().__init__(', '.join(line.item.name for line in lines))
+
+
+class InsufficientBalance(CheckoutError):
+    pass
+
+
+def checkout(order, address, pay_with_wallet=False):
+    # Stock and wallet are checked and updated in one transaction. Product rows
+    # are locked in id order so concurrent checkouts cannot deadlock or oversell.
+    with transaction.atomic():
+        # A second submit of the same cart waits here and then finds it ordered.
+        if not list(Order.objects.select_for_update().filter(pk=order.pk, ordered=False).values_list('id')):
+            raise CheckoutError('This order has already been placed.')
+
+        # Lines are locked before their quantities are read, then products,
+        # the same order cart changes take them in.
+        lines = list(order.items.select_for_update().order_by('id'))
+        quantities = defaultdict(int)
+        for line in lines:
+            quantities[line.item_id] += line.quantity
+
+        products = {product.id: product for product in Product.objects.select_for_update().filter(
+            id__in=quantities).order_by('id').only('name', 'price', 'discount_price', 'stock', 'reserved')}
+        for line in lines:
+            line.item = products[line.item_id]
+        # The buyer's own holds count towards what is available to them.
+        held = defaultdict(int, Reservation.objects.filter(line__in=lines).values(
+            'product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+        available = {pid: product.available + held[pid] for pid, product in products.items()}
+        short = [line for line in lines if quantities[line.item_id] > available.get(line.item_id, 0)]
+        if short:
+            raise OutOfStock(short)
+
+        # Prices are frozen on the lines from the locked products, so the order
+        # keeps what was paid.
+        for line in lines:
+            line.unit_price = line.get_unit_price()
+            line.total_price = line.unit_price * line.quantity
+            line.ordered = True
+            line.in_cart = None
+        total = sum((line.total_price for line in lines), decimal.Decimal('0.00'))
+        if pay_with_wallet:
+            try:
+                wallet.charge(order, total)
+            except wallet.InsufficientBalance:
+                raise InsufficientBalance()
+
+        Product.objects.filter(id__in=quantities).update(stock=F('stock') - Case(
+            *[When(id=pid, then=Value(quantity)) for pid, quantity in quantities.items()],
+            output_field=IntegerField(),
+        ), reserved=F('reserved') - Case(
+            *[When(id=pid, then=Value(held[pid])) for pid in quantities],
+            output_field=IntegerField(),
+        ), updated_at=Now())
+        Reservation.objects.filter(line__in=lines).delete()
+        CartProduct.objects.bulk_update(lines, ['unit_price', 'total_price', 'ordered', 'in_cart'])
+        Order.objects.filter(pk=order.pk).update(
+            ordered=True, date_ordered=timezone.now(), shipping_address=address, total=total)
+        PurchasedProduct.record(order.user_id, list(quantities))
+    return total
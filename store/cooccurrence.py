@@ -0,0 +1,81 @@
+import numpy as np
+from scipy import sparse
+from .associations import rule_rank
+from .models import Order, Product
+
+
+class CooccurrenceEngine:
+    # Item-item association rules from a sparse basket x product matrix.
+    # Rules are single product -> single product, filtered on support and
+    # lift and ranked by associations.rule_rank, the same rules
+    # mine_associations stores as Recommendations.
+
+    def __init__(self, min_support=0.0, min_lift=1.0):
+        self.min_support = min_support
+        self.min_lift = min_lift
+        self.product_ids = np.empty(0, dtype=np.int64)
+        self.baskets = 0
+
+    def fit(self, basket_ids, product_ids):
+        # basket_ids[i] and product_ids[i] describe one ordered cart line.
+        basket_ids = np.asarray(basket_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.product_ids, columns = np.unique(product_ids, return_inverse=True)
+        _, rows = np.unique(basket_ids, return_inverse=True)
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float64), (rows, columns)),
+            shape=(rows.max() + 1 if len(rows) else 0, len(self.product_ids)))
+        # Duplicate lines of a product in one basket count once.
+        matrix.data[:] = 1
+
+        self.baskets = matrix.shape[0]
+        self.counts = np.asarray(matrix.sum(axis=0)).ravel()
+        self.cooccurrence = (matrix.T @ matrix).tocsr()
+        self.cooccurrence.setdiag(0)
+        self.cooccurrence.eliminate_zeros()
+        return self
+
+    def fit_orders(self):
+        rows = Order.items.through.objects.filter(order__ordered=True).values_list(
+            'order_id', 'cartproduct__item_id')
+        lines = np.fromiter(
+            (value for row in rows.iterator() for value in row), dtype=np.int64)
+        return self.fit(lines[0::2], lines[1::2])
+
+    def rules(self, product_id):
+        # Returns (consequents, support, confidence, lift) for one antecedent.
+        index = np.searchsorted(self.product_ids, product_id)
+        if index >= len(self.product_ids) or self.product_ids[index] != product_id:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty, empty
+
+        start, end = self.cooccurrence.indptr[index], self.cooccurrence.indptr[index + 1]
+        columns = self.cooccurrence.indices[start:end]
+        together = self.cooccurrence.data[start:end]
+
+        support = together / self.baskets
+        confidence = together / self.counts[index]
+        lift = confidence / (self.counts[columns] / self.baskets)
+
+        keep = (support >= self.min_support) & (lift >= self.min_lift)
+        return self.product_ids[columns[keep]], support[keep], confidence[keep], lift[keep]
+
+    def top_k(self, product_id, k=4):
+        consequents, support, confidence, lift = self.rules(product_id)
+        if len(support) > k:
+            # Every rule tied with the k-th best support is still a candidate.
+            kth = -np.partition(-support, k - 1)[k - 1]
+            keep = support >= kth
+            consequents, support, confidence, lift = consequents[keep], support[keep], confidence[keep], lift[keep]
+        rules = sorted(zip(support.tolist(), confidence.tolist(), lift.tolist(), consequents.tolist()),
+                       key=lambda rule: rule_rank(*rule))
+        return [rule[3] for rule in rules[:k]]
+
+
+def get_associated(product_id, count=4):
+    # Same call as mba.get_associated(), fitted on the checked out orders
+    # for every call like it. Pages read the stored Recommendations.
+    ids = CooccurrenceEngine().fit_orders().top_k(product_id, count)
+    products = Product.objects.in_bulk(ids)
+    return [products[i] for i in ids if i in products]
@@ -1,3 +1,4 @@
+import decimal
 import re
 from typing import Type
 from django import forms
@@ -26,7 +27,7 @@ class ContactForm(forms.Form):
 	message = forms.CharField(widget = forms.Textarea, max_length = 2000)
 
 class BalanceForm(forms.Form):
-    amount = forms.DecimalField(max_digits=10, decimal_places=2)
+    amount = forms.DecimalField(max_digits=10, decimal_places=2, min_value=decimal.Decimal('0.01'))
 
 class ReviewForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp'}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+ORIENTATION = 0x0112
+
+
+def derivative_name(name, width, fmt):
+    stem = os.path.splitext(name)[0]
+    return f'{settings.IMAGE_DERIVATIVE_DIR}/{stem}-{width}w{EXTENSIONS[fmt]}'
+
+
+def planned_widths(width):
+    # The configured widths below the original and the next one up, which
+    # keeps the original size. Images are never upscaled.
+    smaller = [w for w in settings.IMAGE_WIDTHS if w < width]
+    return settings.IMAGE_WIDTHS[:len(smaller) + 1]
+
+
+def source_width(path):
+    # Width as displayed, EXIF orientations 5-8 turn the image sideways.
+    with Image.open(path) as image:
+        width, height = image.size
+        return height if image.getexif().get(ORIENTATION) in (5, 6, 7, 8) else width
+
+
+def flatten(image):
+    # JPEG has no alpha, transparent images are put on white.
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(source, targets, quality):
+    # Runs in worker processes too, so it only deals with paths.
+    with Image.open(source) as original:
+        image = flatten(original)
+    resized = {}
+    for width, fmt, path in targets:
+        if width not in resized:
+            height = round(image.height * width / image.width)
+            resized[width] = image.resize((width, height), Image.LANCZOS) if width < image.width else image
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.tmp'
+        resized[width].save(temporary, fmt.upper(), quality=quality, optimize=True)
+        os.replace(temporary, path)
+    return len(targets)
+
+
+def stale_targets(name, force=False):
+    source = default_storage.path(name)
+    # Width by width, the last format of a width is written last.
+    targets = [(width, fmt, default_storage.path(derivative_name(name, width, fmt)))
+               for width in planned_widths(source_width(source)) for fmt in settings.IMAGE_FORMATS]
+    if force:
+        return source, targets
+    modified = os.path.getmtime(source)
+    if all(os.path.exists(path) and os.path.getmtime(path) >= modified for _, _, path in targets):
+        return source, []
+    return source, targets
+
+
+def generate_derivatives(name, force=False):
+    source, targets = stale_targets(name, force)
+    written = render(source, targets, settings.IMAGE_QUALITY) if targets else 0
+    remember_widths(name)
+    return written
+
+
+def generate_uploaded(name):
+    # A broken upload is logged, the product stays saved and shows the original.
+    try:
+        generate_derivatives(name)
+    except (OSError, ValueError):
+        logger.exception('Could not generate variants of %s', name)
+
+
+def generate_many(names, workers=None, force=False):
+    # Yields (name, files written, error) as the pool finishes each image.
+    jobs = []
+    for name in names:
+        try:
+            source, targets = stale_targets(name, force)
+        except (OSError, ValueError) as e:
+            yield name, 0, e
+            continue
+        if targets:
+            jobs.append((name, source, targets))
+        else:
+            remember_widths(name)
+            yield name, 0, None
+    if not jobs:
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(render, source, targets, settings.IMAGE_QUALITY): name for name, source, targets in jobs}
+        for future in as_completed(futures):
+            try:
+                written = future.result()
+            except (OSError, ValueError) as e:
+                yield futures[future], 0, e
+            else:
+                remember_widths(futures[future])
+                yield futures[future], written, None
+
+
+def source_names(directory):
+    # Image names under MEDIA_ROOT/directory, without the derivatives.
+    root = default_storage.path('')
+    for dirpath, dirnames, filenames in os.walk(default_storage.path(directory)):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != default_storage.path(settings.IMAGE_DERIVATIVE_DIR)]
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SOURCE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/')
+
+
+def widths_key(name):
+    return f'images:widths:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def stored_widths(name):
+    # (name width, real width) of the variants on disk. The planned widths are
+    # a prefix of IMAGE_WIDTHS, so this stops at the first missing one. The
+    # last variant keeps the original's width when that is smaller.
+    widths = []
+    for width in settings.IMAGE_WIDTHS:
+        if not default_storage.exists(derivative_name(name, width, settings.IMAGE_FORMATS[-1])):
+            break
+        widths.append(width)
+    if not widths:
+        return []
+    try:
+        real = min(widths[-1], source_width(default_storage.path(name)))
+    except (OSError, ValueError):
+        real = widths[-1]
+    return [(width, width) for width in widths[:-1]] + [(widths[-1], real)]
+
+
+def remember_widths(name):
+    cache.set(widths_key(name), stored_widths(name), settings.CATALOG_CACHE_TIMEOUT)
+
+
+def srcset(image, fmt='jpeg'):
+    # Empty until variants exist, the browser uses src then. The widths come
+    # from the cache, they are looked up on disk on a miss and recorded
+    # whenever variants are generated.
+    name = getattr(image, 'name', image)
+    if not name:
+        return ''
+    widths = cache.get(widths_key(name))
+    if widths is None:
+        widths = stored_widths(name)
+        cache.set(widths_key(name), widths, settings.CATALOG_CACHE_TIMEOUT)
+    return ', '.join(f'{default_storage.url(derivative_name(name, width, fmt))} {real}w' for width, real in widths)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import transaction
+from .models import Category, LeaderboardEntry, Product
+
+
+def ranked_products(category_id):
+    products = Product.objects.filter(category_id=category_id, rating_count__gte=settings.LEADERBOARD_MIN_REVIEWS)
+    return products.order_by('-rating_average', '-rating_count', 'id').values_list(
+        'id', 'rating_average')[:settings.LEADERBOARD_SIZE]
+
+
+def refresh_leaderboard(category_id):
+    with transaction.atomic():
+        # Serializes concurrent refreshes of the same category.
+        list(Category.objects.select_for_update().filter(pk=category_id).values_list('id'))
+        LeaderboardEntry.objects.filter(category_id=category_id).delete()
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(category_id=category_id, product_id=product_id, rank=rank)
+            for rank, (product_id, _) in enumerate(ranked_products(category_id))
+        ])
+
+
+def product_rating_changed(product_id):
+    # Only refresh the board when the product is on it or could enter it.
+    product = Product.objects.filter(pk=product_id).values(
+        'category_id', 'rating_average', 'rating_count').first()
+    if product is None:
+        return
+    entries = list(LeaderboardEntry.objects.filter(category_id=product['category_id']).values_list(
+        'product_id', 'product__rating_average'))
+    on_board = any(pid == product_id for pid, _ in entries)
+    qualifies = product['rating_count'] >= settings.LEADERBOARD_MIN_REVIEWS and (
+        len(entries) < settings.LEADERBOARD_SIZE
+        or entries and product['rating_average'] >= min(average for _, average in entries))
+    if on_board or qualifies:
+        refresh_leaderboard(product['category_id'])
+
+
+def best_rated_entries(category_id):
+    return LeaderboardEntry.objects.filter(category_id=category_id).select_related('product')
+
+
+def get_best_rated(category_id):
+    return [entry.product for entry in best_rated_entries(category_id)]
+
+
+def rebuild_leaderboards():
+    # Uses the settings like the incremental refreshes, which would undo
+    # a board built with other values.
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    for category_id in category_ids:
+        refresh_leaderboard(category_id)
+    return len(category_ids)
@@ -0,0 +1,70 @@
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.shortcuts import reverse
+from .models import Product
+from .pagination import cursor_paginate
+
+# Columns a product card in home.html renders, description is never loaded.
+# Stock is left out: cards and listing pages are cached per catalog version,
+# which checkouts and reservations do not move. Product pages show it.
+CARD_FIELDS = (
+    'id', 'name', 'slug', 'price', 'discount_price', 'image',
+    'rating_average', 'rating_count', 'category__title', 'category__slug',
+    'date_added',
+)
+
+
+class ProductCard:
+    __slots__ = CARD_FIELDS
+
+    def __init__(self, row):
+        for field in CARD_FIELDS:
+            setattr(self, field, row[field])
+
+    def __str__(self):
+        return self.name
+
+    def get_absolute_url(self):
+        return reverse("product", kwargs={ "slug": self.slug})
+
+    @property
+    def image_url(self):
+        return default_storage.url(self.image)
+
+    def get_rating(self):
+        return round(self.rating_average, 1)
+
+    def count_reviews(self):
+        return self.rating_count
+
+
+# Newest first, seeking on (date_added, id) so deep pages cost the same.
+LISTING_ORDER = ('date_added', 'id')
+LISTING_PER_PAGE = 8
+
+
+def listing_products(category=None):
+    return Product.objects.filter(category=category) if category else Product.objects.all()
+
+
+def card_rows(products):
+    return products.values(*CARD_FIELDS)
+
+
+def get_listing_page(products, page, per_page=LISTING_PER_PAGE):
+    # One COUNT and one SELECT, whatever the page size.
+    paginator = Paginator(card_rows(products), per_page)
+    try:
+        page = paginator.page(page)
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    page.object_list = [ProductCard(row) for row in page.object_list]
+    return page
+
+
+def get_listing_cursor_page(products, cursor, per_page=LISTING_PER_PAGE):
+    page = cursor_paginate(card_rows(products), LISTING_ORDER, cursor, per_page)
+    page.object_list = [ProductCard(row) for row in page.object_list]
+    return page
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.query_audit import HOT_QUERIES, audit, get_samples
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot view queries and flag full table scans and filesorts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', choices=[[]] + list(HOT_QUERIES),
+                            help='Only these queries.')
+        parser.add_argument('--plans', action='store_true',
+                            help='Print every plan, not only the flagged ones.')
+
+    def handle(self, *args, **options):
+        samples = get_samples()
+        if samples is None:
+            raise CommandError('The audit needs at least one review to pick sample rows from.')
+
+        flagged = 0
+        for name, plan, problems in audit(samples, options['names']):
+            if problems:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(f'{name}: {", ".join(problems)}'))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if problems or options['plans']:
+                for row in plan:
+                    self.stdout.write('    ' + ' '.join(f'{key}={value}' for key, value in row.items()))
+        if flagged:
+            raise CommandError(f'{flagged} queries scan or sort whole tables.')
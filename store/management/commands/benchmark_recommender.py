@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from store.cooccurrence import CooccurrenceEngine
+from store.mba import get_associated_ids
+
+
+def synthetic_baskets(products, baskets, seed=0):
+    # Basket sizes of 10-30 lines like mba.get_associated(), with a skewed
+    # product popularity so that some rules pass the support threshold.
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, products + 1)
+    popularity /= popularity.sum()
+    sizes = rng.integers(10, 31, size=baskets)
+    basket_ids = np.repeat(np.arange(baskets), sizes)
+    product_ids = rng.choice(products, size=sizes.sum(), p=popularity)
+    return basket_ids, product_ids
+
+
+class Command(BaseCommand):
+    help = 'Compare the apriori recommender with the sparse co-occurrence engine on synthetic baskets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--baskets', type=int, default=2000)
+        parser.add_argument('--queries', type=int, default=20,
+                            help='Number of products looked up per engine.')
+        parser.add_argument('--skip-apriori', action='store_true')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'products':>10} {'apriori/call':>14} {'sparse fit':>12} {'sparse/call':>12}")
+        for products in options['products']:
+            basket_ids, product_ids = synthetic_baskets(products, options['baskets'])
+            queries = np.random.default_rng(1).choice(product_ids, size=options['queries'])
+
+            apriori = '-'
+            if not options['skip_apriori']:
+                dataset = [[] for _ in range(options['baskets'])]
+                for basket, product in zip(basket_ids.tolist(), product_ids.tolist()):
+                    dataset[basket].append(product)
+                try:
+                    start = time.perf_counter()
+                    get_associated_ids(dataset, int(queries[0]))
+                    apriori = f'{time.perf_counter() - start:.4f}s'
+                except MemoryError:
+                    apriori = 'out of memory'
+
+            start = time.perf_counter()
+            engine = CooccurrenceEngine(min_support=0.1).fit(basket_ids, product_ids)
+            fit = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for product in queries:
+                engine.top_k(int(product))
+            per_call = (time.perf_counter() - start) / len(queries)
+
+            self.stdout.write(f'{products:>10} {apriori:>14} {fit:>11.4f}s {per_call:>11.6f}s')
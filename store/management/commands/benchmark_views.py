@@ -0,0 +1,238 @@
+import json
+import platform
+import statistics
+import subprocess
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from cities_light.models import Region
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from store.cart import get_cart_store
+from store.listings import get_listing_cursor_page
+from store.models import Category, Order, Product, Review
+
+LOGIN_REQUIRED = ('subregions', 'cart', 'checkout', 'orders', 'wallet')
+
+
+def listing_page(page):
+    # Cursor listings ignore ?page=, so walk the next links the page renders.
+    if settings.LISTING_PAGE_NUMBERS:
+        return reverse('home') + f'?page={page}'
+    cursor = None
+    for _ in range(page - 1):
+        next_cursor = get_listing_cursor_page(Product.objects.all(), cursor).next_cursor
+        if next_cursor is None:
+            break
+        cursor = next_cursor
+    return reverse('home') + (f'?cursor={cursor}' if cursor else '')
+
+
+def targets():
+    product = Product.objects.order_by('-rating_count', 'id').first()
+    category = Category.objects.order_by('id').first()
+    if product is None or category is None:
+        raise CommandError('No products to benchmark, run generate_data first.')
+    word = product.name.split()[0]
+    region = Region.objects.order_by('id').first()
+    urls = {
+        'home': reverse('home'),
+        'home_page_5': listing_page(5),
+        'category': reverse('category_home', args=[category.slug]),
+        'search': reverse('home') + f'?q={word}',
+        'product': reverse('product', args=[product.slug]),
+        'reviews': reverse('ajax_reviews') + f'?product_id={product.id}',
+        'subregions': reverse('ajax_load_subregions') + f'?region_id={region.id if region else ""}',
+        'cart': reverse('cart'),
+        'checkout': reverse('checkout'),
+        'orders': reverse('orders'),
+        'wallet': reverse('wallet'),
+    }
+    return urls, product
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def summarize(timings, errors, queries, elapsed):
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'rps': round(len(timings) / elapsed, 2) if elapsed else None,
+        'queries': round(queries / len(timings), 2) if queries is not None else None,
+    }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Measure latency and throughput of the main views through the test client or a running server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', help='Views to run, all by default.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per view.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per view.')
+        parser.add_argument('--user', help='Username for the logged in views, defaults to the first synthetic user.')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1],
+                            help='Parallel clients against --url, every view runs once per level.')
+        parser.add_argument('--label', default='', help='Free text stored with the results.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        # Client requests come from the test client's host.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        urls, product = targets()
+        names = options['views'] or list(urls)
+        unknown = set(names) - set(urls)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}. Choose from {', '.join(urls)}.")
+        levels = options['concurrency'] if options['url'] else [1]
+
+        session = None
+        if options['url'] and set(names) & set(LOGIN_REQUIRED):
+            # The server shares the database, so a session made here logs it in.
+            client = Client()
+            client.force_login(self.get_user(options['user'], product))
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        results = []
+        self.stdout.write(f"{'view':<12} {'clients':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9} {'queries':>8} {'errors':>7}")
+        for name in names:
+            for concurrency in levels:
+                if options['url']:
+                    cookie = session if name in LOGIN_REQUIRED else None
+                    result = self.run_live(options['url'].rstrip('/') + urls[name], cookie, concurrency, options)
+                else:
+                    client = Client()
+                    if name in LOGIN_REQUIRED:
+                        client.force_login(self.get_user(options['user'], product))
+                    result = self.run_client(client, urls[name], options)
+                results.append(dict(result, view=name, url=urls[name], concurrency=concurrency))
+                queries = '-' if result['queries'] is None else result['queries']
+                self.stdout.write(
+                    f"{name:<12} {concurrency:>7} {result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms "
+                    f"{result['p99_ms']:>7.2f}ms {result['rps']:>9.1f} {queries:>8} {result['errors']:>7}")
+
+        # Timings of error pages say nothing about the view, so nothing is written.
+        failed = sorted({run['view'] for run in results if run['errors']})
+        if failed:
+            raise CommandError(f"Requests failed for {', '.join(failed)}, no results written.")
+
+        if options['output']:
+            report = {
+                'label': options['label'],
+                'started': datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'mode': 'live' if options['url'] else 'client',
+                'server': options['url'],
+                'debug': settings.DEBUG,
+                'async_ajax': settings.ASYNC_AJAX,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'dataset': {
+                    'products': Product.objects.count(),
+                    'users': User.objects.count(),
+                    'reviews': Review.objects.count(),
+                    'orders': Order.objects.filter(ordered=True).count(),
+                },
+                'runs': results,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def get_user(self, username, product):
+        users = User.objects.filter(username=username) if username else \
+            User.objects.filter(username__startswith='synthetic-', address__isnull=False).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to log in with, pass --user or run generate_data first.')
+        # The cart and checkout pages need something in the cart.
+        if not get_cart_store().count(user):
+            get_cart_store().add(user, product, 1)
+        return user
+
+    def run_client(self, client, url, options):
+        for _ in range(options['warmup']):
+            client.get(url)
+        counter = QueryCounter()
+        timings = []
+        errors = 0
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+        return summarize(timings, errors, counter.count, time.perf_counter() - started)
+
+    def run_live(self, url, session, concurrency, options):
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session}'} if session else {}
+
+        def fetch():
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+                    response.read()
+                    # A login redirect means the session was not accepted.
+                    return response.geturl() != url
+            except OSError:
+                return True
+
+        for _ in range(options['warmup']):
+            fetch()
+        timings = []
+        errors = []
+        remaining = iter(range(options['requests']))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                failed = fetch()
+                with lock:
+                    timings.append(time.perf_counter() - start)
+                    errors.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(timings, sum(errors), None, time.perf_counter() - started)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.cart import get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Write carts kept in the cache to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=0,
+                            help='Only carts untouched for this many seconds.')
+
+    def handle(self, *args, **options):
+        cart_store = get_cart_store()
+        if not hasattr(cart_store, 'flush'):
+            raise CommandError('CART_STORE writes carts to the database already.')
+        flushed = cart_store.flush(options['older_than'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts.'))
@@ -0,0 +1,229 @@
+import decimal
+import random
+import time
+from datetime import timedelta
+from cities_light.models import Country, Region
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from store.associations import mine_associations
+from store.caching import bump_catalog_version
+from store.leaderboards import rebuild_leaderboards
+from store.models import (
+    Address, Balance, CartProduct, Category, LedgerEntry, Order, Product, PurchasedProduct, Review,
+)
+from store.ratings import rebuild_ratings
+from store.search import get_backend
+
+WORDS = (
+    'kalem', 'defter', 'silgi', 'cetvel', 'kağıt', 'dosya', 'klasör', 'boya', 'fırça', 'makas',
+    'yapıştırıcı', 'zımba', 'ajanda', 'kalemlik', 'marker', 'pastel', 'tebeşir', 'etiket', 'zarf', 'bant',
+    'blue', 'black', 'red', 'green', 'large', 'small', 'pocket', 'premium', 'school', 'office',
+)
+CENT = decimal.Decimal('0.01')
+
+
+def next_id(model):
+    # Rows get explicit ids so related rows can be built before inserting,
+    # MySQL does not return ids from bulk inserts.
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic catalog, customers, reviews and order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplies every count below.')
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--reviews', type=float, default=5,
+                            help='Average reviews per product.')
+        parser.add_argument('--orders', type=float, default=3,
+                            help='Average past orders per user.')
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Prefix of usernames, slugs and titles, has to be unused.')
+        parser.add_argument('--password', default='synthetic',
+                            help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Skip ratings, leaderboards and recommendations.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Data with prefix {prefix!r} exists already, pick another --prefix.')
+
+        scale = options['scale']
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = prefix
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            categories = self.create_categories(max(1, round(options['categories'] * scale)))
+            products = self.create_products(max(1, round(options['products'] * scale)), categories)
+            users = self.create_users(max(1, round(options['users'] * scale)), options['password'])
+            addresses = self.create_addresses(users)
+            reviews = self.create_reviews(products, users, options['reviews'])
+            orders, lines = self.create_orders(products, users, addresses, options['orders'])
+            self.fill_purchased_products(users)
+            self.reset_sequences()
+
+        if not options['skip_derived']:
+            rebuild_ratings(self.batch_size)
+            rebuild_leaderboards()
+            mine_associations()
+        bump_catalog_version()
+        get_backend().changed([])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(categories)} categories, {len(products)} products, {len(users)} users, '
+            f'{reviews} reviews, {orders} orders with {lines} lines '
+            f'in {time.perf_counter() - started:.1f}s.'))
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def create_categories(self, count):
+        first = next_id(Category)
+        categories = [
+            Category(id=first + i, title=f'{self.prefix} {text(self.rng, 2)} {i}', slug=f'{self.prefix}-category-{i}')
+            for i in range(count)
+        ]
+        self.bulk_create(Category, categories)
+        return categories
+
+    def create_products(self, count, categories):
+        first = next_id(Product)
+        products = []
+        for i in range(count):
+            price = round(self.rng.uniform(2, 500), 2)
+            products.append(Product(
+                id=first + i,
+                name=f'{text(self.rng, 3)} {i}'.capitalize(),
+                price=price,
+                discount_price=round(price * 0.8, 2) if self.rng.random() < 0.2 else None,
+                description=text(self.rng, 40),
+                stock=self.rng.randint(0, 200),
+                slug=f'{self.prefix}-product-{i}',
+                category=self.rng.choice(categories),
+            ))
+        self.bulk_create(Product, products)
+        return products
+
+    def create_users(self, count, password):
+        first = next_id(User)
+        password = make_password(password)
+        users = [
+            User(id=first + i, username=f'{self.prefix}-{i}', email=f'{self.prefix}-{i}@example.com', password=password)
+            for i in range(count)
+        ]
+        self.bulk_create(User, users)
+
+        balances = [decimal.Decimal(self.rng.randint(0, 5000)) for _ in users]
+        self.bulk_create(Balance, [Balance(user=user, balance=balance) for user, balance in zip(users, balances)])
+        self.bulk_create(LedgerEntry, [
+            LedgerEntry(user=user, kind=LedgerEntry.OPENING, amount=balance)
+            for user, balance in zip(users, balances) if balance
+        ])
+        return users
+
+    def create_addresses(self, users):
+        region = Region.objects.first()
+        if region is None:
+            country, _ = Country.objects.get_or_create(name='Synthetic', defaults={
+                'code2': 'SY', 'code3': 'SYN', 'continent': 'AS', 'tld': 'sy', 'geoname_id': 900000001})
+            region = Region.objects.create(name='Synthetic', country=country, geoname_id=900000002)
+        first = next_id(Address)
+        addresses = [
+            Address(id=first + i, user=user, address=text(self.rng, 5), region=region, zip=str(self.rng.randint(10000, 99999)))
+            for i, user in enumerate(users)
+        ]
+        self.bulk_create(Address, addresses)
+        return addresses
+
+    def create_reviews(self, products, users, average):
+        reviews = []
+        for product in products:
+            count = min(len(users), self.rng.randint(0, round(average * 2)))
+            for user in self.rng.sample(users, count):
+                reviews.append(Review(
+                    product=product,
+                    user=user,
+                    subject=text(self.rng, 3)[:40],
+                    comment=text(self.rng, 20) if self.rng.random() < 0.7 else '',
+                    rating=self.rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 5))[0],
+                ))
+            if len(reviews) >= self.batch_size:
+                self.bulk_create(Review, reviews)
+                reviews = []
+        self.bulk_create(Review, reviews)
+        return Review.objects.filter(user__in=users).count()
+
+    def create_orders(self, products, users, addresses, average):
+        # Popular products are bought more often, so there are rules to mine.
+        weights = [1 / (rank + 1) for rank in range(len(products))]
+        now = timezone.now()
+        order_id = next_id(Order)
+        line_id = next_id(CartProduct)
+        orders, lines, links = [], [], []
+        total_orders = total_lines = 0
+        for user, address in zip(users, addresses):
+            for _ in range(self.rng.randint(0, round(average * 2))):
+                order = Order(
+                    id=order_id, user=user, shipping_address=address, ordered=True,
+                    date_ordered=now - timedelta(seconds=self.rng.randint(0, 365 * 24 * 3600)),
+                )
+                total = decimal.Decimal('0.00')
+                bought = {product.id: product for product in self.rng.choices(products, weights, k=self.rng.randint(1, 4))}
+                for product in bought.values():
+                    unit_price = decimal.Decimal(str(product.discount_price or product.price)).quantize(CENT)
+                    quantity = self.rng.randint(1, 3)
+                    lines.append(CartProduct(
+                        id=line_id, user=user, item=product, quantity=quantity, ordered=True, in_cart=None,
+                        unit_price=unit_price, total_price=unit_price * quantity,
+                    ))
+                    links.append(Order.items.through(order_id=order_id, cartproduct_id=line_id))
+                    total += unit_price * quantity
+                    line_id += 1
+                order.total = total
+                orders.append(order)
+                order_id += 1
+            if len(lines) >= self.batch_size:
+                total_orders, total_lines = total_orders + len(orders), total_lines + len(lines)
+                self.save_orders(orders, lines, links)
+                orders, lines, links = [], [], []
+        self.save_orders(orders, lines, links)
+        return total_orders + len(orders), total_lines + len(lines)
+
+    def save_orders(self, orders, lines, links):
+        self.bulk_create(Order, orders)
+        self.bulk_create(CartProduct, lines)
+        self.bulk_create(Order.items.through, links)
+
+    def fill_purchased_products(self, users):
+        rows = Order.items.through.objects.filter(order__user__in=users).values(
+            'order__user_id', 'cartproduct__item_id').annotate(
+            first=Min('order__date_ordered'), last=Max('order__date_ordered'))
+        self.bulk_create(PurchasedProduct, [
+            PurchasedProduct(user_id=row['order__user_id'], product_id=row['cartproduct__item_id'],
+                             first_purchased=row['first'], last_purchased=row['last'])
+            for row in rows
+        ])
+
+    def reset_sequences(self):
+        sql = connection.ops.sequence_reset_sql(no_style(), [Category, Product, User, Address, Order, CartProduct])
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
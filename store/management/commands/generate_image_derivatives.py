@@ -0,0 +1,42 @@
+import os
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from store.caching import bump_catalog_version
+from store.images import generate_many, source_names
+
+
+class Command(BaseCommand):
+    help = 'Write the resized JPEG and WebP variants of product images, skipping up to date ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['product_pic'],
+                            help='Directories or files under MEDIA_ROOT.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes, one per CPU by default.')
+        parser.add_argument('--force', action='store_true', help='Regenerate up to date variants too.')
+
+    def handle(self, *args, **options):
+        names = []
+        for path in options['paths']:
+            if os.path.isdir(default_storage.path(path)):
+                names.extend(source_names(path))
+            elif default_storage.exists(path):
+                names.append(path)
+            else:
+                raise CommandError(f'{path} does not exist under {settings.MEDIA_ROOT}.')
+
+        written = skipped = failed = 0
+        for name, files, error in generate_many(names, options['workers'], options['force']):
+            if error is not None:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            elif files:
+                written += 1
+            else:
+                skipped += 1
+        # Cached product cards pick up the new srcset.
+        if written:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants of {written} images, {skipped} up to date, {failed} failed.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from store.associations import mine_associations
+
+
+class Command(BaseCommand):
+    help = 'Mine product association rules from ordered carts and store the top recommendations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only count orders no run has counted yet.')
+        parser.add_argument('--top', type=int, default=4,
+                            help='Number of recommendations kept per product.')
+        parser.add_argument('--min-support', type=float, default=0.0)
+        parser.add_argument('--min-lift', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        baskets, created = mine_associations(
+            incremental=options['incremental'],
+            top_k=options['top'],
+            min_support=options['min_support'],
+            min_lift=options['min_lift'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {baskets} orders, saved {created} recommendations.'))
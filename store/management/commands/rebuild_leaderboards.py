@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Recompute the best rated products of every category from LEADERBOARD_SIZE and LEADERBOARD_MIN_REVIEWS.'
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_leaderboards()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt leaderboards of {rebuilt} categories.'))
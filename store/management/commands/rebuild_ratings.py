@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating average, count and star histogram of every product.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_ratings(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings of {rebuilt} products.'))
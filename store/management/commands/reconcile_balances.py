@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from store.wallet import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Check every wallet balance against its snapshot and the wallet ledger.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Wallets locked and checked per transaction.')
+        parser.add_argument('--full', action='store_true',
+                            help='Also sum the whole ledger to check the snapshots.')
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for user_id, balance, expected in reconcile(options['batch_size'], options['full']):
+            mismatches += 1
+            self.stdout.write(f'User {user_id}: balance {balance}, ledger {expected}')
+        if mismatches:
+            raise CommandError(f'{mismatches} wallets do not match the ledger.')
+        self.stdout.write(self.style.SUCCESS('All wallets match the ledger.'))
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from store.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Put the stock held by expired cart reservations back on sale.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Expired reservations picked up per transaction.')
+        parser.add_argument('--every', type=int, default=None,
+                            help='Keep running and release every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(options['batch_size'])
+            self.stdout.write(f'Released {released} reserved items.')
+            if not options['every']:
+                break
+            time.sleep(options['every'])
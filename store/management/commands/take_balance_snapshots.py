@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store.wallet import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Roll new wallet ledger entries into the per user balance snapshots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Wallets locked and snapshotted per transaction.')
+
+    def handle(self, *args, **options):
+        taken = take_snapshots(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {taken} balance snapshots.'))
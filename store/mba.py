@@ -1,4 +1,3 @@
-
 import pandas as pd
 from mlxtend.frequent_patterns import apriori
 from mlxtend.frequent_patterns import association_rules
@@ -6,21 +5,7 @@ from mlxtend.preprocessing import TransactionEncoder
 import random as rand
 from .models import Product
 
-def get_associated(product):
-
-    dataset = []
-
-    products = Product.objects.values_list('id', flat=True)
-    print(product)
-
-    # Create random training data
-    for i in range (0,40):
-        l_size = rand.randint(10,30)
-        order = []
-        for j in range(0, l_size):
-            order.append(rand.choice(products))
-        dataset.append(order)
-
+def get_associated_ids(dataset, product, count=4):
 
     # Encode data to use apriori algorithm
     te = TransactionEncoder()
@@ -29,24 +14,35 @@ def get_associated(product):
 
     # Apply apriori algorithm and find frequent item sets
     rule_sets = apriori(df, min_support=0.1, use_colnames=True)
+    if rule_sets.empty:
+        return []
     # Apply rules and find associations.
     rules = association_rules(rule_sets, metric="lift", min_threshold=1)
     # Filtering results..
     rules = rules[ (rules['lift'] >= 0.9) & (rules['antecedents'] == frozenset({product}))]
-    print(rules)
 
     rules = rules.sort_values(by=['support'], ascending=False)
-    rules = rules[ rules['consequents'].apply(lambda x: len(x) == 1 ) ]['consequents'][0:4]
+    rules = rules[ rules['consequents'].apply(lambda x: len(x) == 1 ) ]['consequents'][0:count]
 
-    print(rules)
+    return [list(i)[0] for i in rules]
+
+def get_associated(product):
+
+    dataset = []
+
+    products = Product.objects.values_list('id', flat=True)
+
+    # Create random training data
+    for i in range (0,40):
+        l_size = rand.randint(10,30)
+        order = []
+        for j in range(0, l_size):
+            order.append(rand.choice(products))
+        dataset.append(order)
 
     recommended = []
 
-    for i in rules:
-        value = list(i)[0]
+    for value in get_associated_ids(dataset, product):
         recommended.append(Product.objects.get(id=value))
 
-    print(recommended)
-
     return recommended
-
@@ -0,0 +1,201 @@
+import asyncio
+import bisect
+import contextvars
+import heapq
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from .caching import get_stats
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1000, 10000, 50000, 100000, 500000, 1000000)
+SLOW_SQL_LOGGED = 50
+
+
+class Histogram:
+    # Cumulative buckets per view, in Prometheus text format.
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, view, value):
+        counts = self.values.get(view)
+        if counts is None:
+            counts = self.values.setdefault(view, [0] * (len(self.buckets) + 1) + [0])
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for view, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {total}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {counts[-1]:.6f}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {total}')
+        return lines
+
+
+# Histograms live in the process, every worker reports its own requests.
+lock = threading.Lock()
+HISTOGRAMS = {
+    'wall': Histogram('store_request_seconds', 'Wall time of requests by view.', TIME_BUCKETS),
+    'queries': Histogram('store_request_sql_queries', 'SQL queries per request by view.', QUERY_BUCKETS),
+    'sql': Histogram('store_request_sql_seconds', 'Time spent in SQL per request by view.', TIME_BUCKETS),
+    'template': Histogram('store_request_template_seconds', 'Template render time per request by view.', TIME_BUCKETS),
+    'size': Histogram('store_response_bytes', 'Response body size by view.', SIZE_BUCKETS),
+}
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql_time', 'template_time', 'template_depth', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            # A heap of the slowest statements so far, the fastest on top.
+            if len(self.statements) < SLOW_SQL_LOGGED:
+                heapq.heappush(self.statements, (duration, sql))
+            else:
+                heapq.heappushpop(self.statements, (duration, sql))
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        # Included templates render inside their parent, only time the outermost.
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # DjangoTemplates that reports render time to MetricsMiddleware.
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection, so queries count for the request that
+    # runs them in whichever thread that happens.
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks __call__ as returning a coroutine, like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def acall(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.observe(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, metrics, wall):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        with lock:
+            HISTOGRAMS['wall'].observe(view, wall)
+            HISTOGRAMS['queries'].observe(view, metrics.queries)
+            HISTOGRAMS['sql'].observe(view, metrics.sql_time)
+            HISTOGRAMS['template'].observe(view, metrics.template_time)
+            if size is not None:
+                HISTOGRAMS['size'].observe(view, size)
+
+        if wall >= settings.METRICS_SLOW_REQUEST and random.random() < settings.METRICS_SLOW_SAMPLE_RATE:
+            log_slow_request(request, view, wall, metrics)
+
+
+def log_slow_request(request, view, wall, metrics):
+    statements = sorted(metrics.statements, key=lambda statement: -statement[0])
+    logger.warning(
+        'Slow request %s %s (%s): %.3fs, %d queries in %.3fs, templates %.3fs\n%s',
+        request.method, request.path, view, wall, metrics.queries, metrics.sql_time, metrics.template_time,
+        '\n'.join(f'  {duration * 1000:.1f}ms {sql}' for duration, sql in statements),
+    )
+
+
+def render_metrics():
+    with lock:
+        lines = []
+        for histogram in HISTOGRAMS.values():
+            lines.extend(histogram.render())
+    lines.append('# HELP store_cache_requests_total Catalog cache lookups by section and outcome.')
+    lines.append('# TYPE store_cache_requests_total counter')
+    stats = get_stats()
+    for section, values in stats.items():
+        if isinstance(values, dict):
+            for outcome in ('hits', 'misses'):
+                lines.append(f'store_cache_requests_total{{section="{section}",outcome="{outcome}"}} {values[outcome]}')
+    lines.append('# HELP store_catalog_version Current catalog cache version.')
+    lines.append('# TYPE store_catalog_version gauge')
+    lines.append(f'store_catalog_version {stats["catalog_version"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.7 on 2026-10-18 06:57
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_ratings(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    stars = {f'stars_{i}': Count('id', filter=Q(rating=i)) for i in range(1, 6)}
+    for row in Review.objects.values('product_id').annotate(**stars):
+        count = sum(row[f'stars_{i}'] for i in range(1, 6))
+        total = sum(row[f'stars_{i}'] * i for i in range(1, 6))
+        Product.objects.filter(pk=row.pop('product_id')).update(
+            rating_count=count,
+            rating_average=total / count if count else 0,
+            **row,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_1',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_2',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_3',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_4',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='stars_5',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('CREATE FULLTEXT INDEX store_product_search ON store_product (name, description)')
+    schema_editor.execute('CREATE FULLTEXT INDEX store_category_search ON store_category (title)')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX store_product_search ON store_product')
+    schema_editor.execute('DROP INDEX store_category_search ON store_category')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
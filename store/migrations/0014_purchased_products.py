@@ -0,0 +1,46 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models import Max, Min
+
+
+def fill_purchased_products(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    PurchasedProduct = apps.get_model('store', 'PurchasedProduct')
+    rows = Order.items.through.objects.filter(order__ordered=True).values(
+        'order__user_id', 'cartproduct__item_id').annotate(
+        first=Min('order__date_ordered'), last=Max('order__date_ordered'))
+    PurchasedProduct.objects.bulk_create([
+        PurchasedProduct(user_id=row['order__user_id'], product_id=row['cartproduct__item_id'],
+                         first_purchased=row['first'], last_purchased=row['last'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0013_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchasedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_purchased', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_purchased', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchased_products', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-last_purchased',),
+                'unique_together': {('user', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_purchased_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_leaderboards(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    LeaderboardEntry = apps.get_model('store', 'LeaderboardEntry')
+    for category in Category.objects.all():
+        products = category.products.filter(rating_count__gte=settings.LEADERBOARD_MIN_REVIEWS)
+        ranked = products.order_by('-rating_average', '-rating_count', 'id')[:settings.LEADERBOARD_SIZE]
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(category=category, product=product, rank=rank)
+            for rank, product in enumerate(ranked)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_purchased_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard', to='store.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+                'ordering': ('category', 'rank'),
+                'unique_together': {('category', 'rank')},
+            },
+        ),
+        migrations.RunPython(fill_leaderboards, migrations.RunPython.noop),
+    ]
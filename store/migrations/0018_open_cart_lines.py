@@ -0,0 +1,42 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Q, Sum
+
+
+def close_lines(apps, schema_editor):
+    # Lines of placed orders leave the unique key, duplicate open lines are
+    # merged into the oldest one. Checkout never set CartProduct.ordered
+    # before, so placed lines are found through their order.
+    CartProduct = apps.get_model('store', 'CartProduct')
+    Order = apps.get_model('store', 'Order')
+    placed = Order.items.through.objects.filter(order__ordered=True).values('cartproduct_id')
+    CartProduct.objects.filter(Q(ordered=True) | Q(id__in=placed)).update(in_cart=None, ordered=True)
+    duplicates = CartProduct.objects.filter(ordered=False).values('user_id', 'item_id').annotate(
+        lines=Count('id'), first=Min('id'), total=Sum('quantity')).filter(lines__gt=1)
+    for row in duplicates:
+        CartProduct.objects.filter(pk=row['first']).update(quantity=row['total'])
+        CartProduct.objects.filter(user_id=row['user_id'], item_id=row['item_id'], ordered=False).exclude(
+            pk=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0017_wallet_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartproduct',
+            name='in_cart',
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(close_lines, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cartproduct',
+            unique_together={('user', 'item', 'in_cart')},
+        ),
+    ]
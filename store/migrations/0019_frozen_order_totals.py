@@ -0,0 +1,60 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:12
+
+import decimal
+from django.db import migrations, models
+
+
+def freeze_past_orders(apps, schema_editor):
+    # Past orders only have today's prices to go by. Their lines are found
+    # through the order, checkout never set CartProduct.ordered before.
+    CartProduct = apps.get_model('store', 'CartProduct')
+    Order = apps.get_model('store', 'Order')
+    cent = decimal.Decimal('0.01')
+    placed = Order.items.through.objects.filter(order__ordered=True)
+    lines = CartProduct.objects.filter(
+        id__in=placed.values('cartproduct_id'), unit_price__isnull=True).select_related('item')
+    batch = []
+    for line in lines.iterator():
+        line.unit_price = decimal.Decimal(str(line.item.discount_price or line.item.price)).quantize(cent)
+        line.total_price = line.unit_price * line.quantity
+        batch.append(line)
+        if len(batch) == 1000:
+            CartProduct.objects.bulk_update(batch, ['unit_price', 'total_price'])
+            batch = []
+    CartProduct.objects.bulk_update(batch, ['unit_price', 'total_price'])
+
+    # Orders without lines keep no total, get_total() then sums the lines.
+    totals = placed.values('order_id').annotate(total=models.Sum('cartproduct__total_price')).order_by()
+    batch = []
+    for row in totals.iterator():
+        batch.append(Order(pk=row['order_id'], total=row['total']))
+        if len(batch) == 1000:
+            Order.objects.bulk_update(batch, ['total'])
+            batch = []
+    Order.objects.bulk_update(batch, ['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_open_cart_lines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartproduct',
+            name='total_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartproduct',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(freeze_past_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def drop_duplicates(apps, schema_editor):
+    # Repeated slugs get the product id appended, a user keeps only their
+    # latest review of a product.
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    slugs = Product.objects.order_by().values('slug').annotate(n=Count('id')).filter(n__gt=1).values_list('slug', flat=True)
+    for slug in list(slugs):
+        for product in Product.objects.filter(slug=slug).order_by('id')[1:]:
+            suffix = f'-{product.pk}'
+            Product.objects.filter(pk=product.pk).update(slug=slug[:50 - len(suffix)] + suffix)
+
+    products = set()
+    duplicates = Review.objects.order_by().values('product_id', 'user_id').annotate(n=Count('id'), last=Max('id')).filter(n__gt=1)
+    for row in duplicates:
+        Review.objects.filter(product_id=row['product_id'], user_id=row['user_id']).exclude(pk=row['last']).delete()
+        products.add(row['product_id'])
+
+    # Same aggregates as migration 0012, for the products that lost reviews.
+    stars = {f'stars_{i}': Count('id', filter=Q(rating=i)) for i in range(1, 6)}
+    for row in Review.objects.filter(product_id__in=products).values('product_id').annotate(**stars):
+        count = sum(row[f'stars_{i}'] for i in range(1, 6))
+        total = sum(row[f'stars_{i}'] * i for i in range(1, 6))
+        Product.objects.filter(pk=row.pop('product_id')).update(
+            rating_count=count,
+            rating_average=total / count if count else 0,
+            **row,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0019_frozen_order_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='review',
+            unique_together={('product', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'date_ordered'], name='order_user_date_ordered'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['date_added'], name='product_date_added'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'date_added'], name='product_category_date_added'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'updated_at'], name='review_product_updated_at'),
+        ),
+    ]
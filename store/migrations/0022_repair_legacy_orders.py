@@ -0,0 +1,24 @@
+# Generated by Django 3.2.7 on 2026-10-18 07:59
+
+from importlib import import_module
+from django.db import migrations
+
+
+def repair(apps, schema_editor):
+    # Earlier versions of 0018 and 0019 only looked at lines with
+    # CartProduct.ordered set, so lines of orders placed before them stayed
+    # in carts and their orders got a total of 0. Both run again with the
+    # fixed selection, lines priced since then keep their prices.
+    import_module('store.migrations.0018_open_cart_lines').close_lines(apps, schema_editor)
+    import_module('store.migrations.0019_frozen_order_totals').freeze_past_orders(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(repair, migrations.RunPython.noop),
+    ]
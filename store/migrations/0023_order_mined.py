@@ -0,0 +1,32 @@
+# Generated by Django 3.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def mark_mined(apps, schema_editor):
+    # Orders up to the last run's watermark are already in Cooccurrence.
+    AssociationRun = apps.get_model('store', 'AssociationRun')
+    Order = apps.get_model('store', 'Order')
+    last_run = AssociationRun.objects.order_by('-finished_at').first()
+    if last_run is not None and last_run.last_ordered is not None:
+        Order.objects.filter(ordered=True, date_ordered__lte=last_run.last_ordered).update(mined=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_repair_legacy_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='mined',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_mined, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='associationrun',
+            name='last_ordered',
+        ),
+    ]
@@ -1,7 +1,7 @@
+import decimal
 from django.db import models
 from django.shortcuts import reverse
 from django.contrib.auth.models import User
-from django.db.models import Avg, Count
 from django_countries.fields import CountryField
 from cities_light.models import City, Region, SubRegion
 from django.utils import timezone
@@ -27,18 +27,34 @@ class Product(models.Model):
     price = models.FloatField()
     description = models.TextField()
     stock = models.IntegerField(default=0)
-    slug = models.SlugField()
+    # Quantity held by carts when STOCK_RESERVATIONS is on, see store.reservations.
+    reserved = models.IntegerField(default=0, editable=False)
+    slug = models.SlugField(unique=True)
     discount_price = models.FloatField(blank=True, null=True)
     image = models.ImageField(upload_to='product_pic', default='default.jpg')
     category = models.ForeignKey(Category, related_name="products", on_delete=models.CASCADE)
     date_added = models.DateTimeField(
         auto_now_add=True, verbose_name="Product Date Added"
     )
+    # Also set by the stock and reservation updates, it dates the product page.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Review aggregates, kept current by store.ratings on every review write.
+    rating_average = models.FloatField(default=0, editable=False)
+    rating_count = models.IntegerField(default=0, editable=False)
+    stars_1 = models.IntegerField(default=0, editable=False)
+    stars_2 = models.IntegerField(default=0, editable=False)
+    stars_3 = models.IntegerField(default=0, editable=False)
+    stars_4 = models.IntegerField(default=0, editable=False)
+    stars_5 = models.IntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = "Product"
         verbose_name_plural = "Products"
         ordering = ("-date_added",)
+        indexes = [
+            models.Index(fields=['date_added'], name='product_date_added'),
+            models.Index(fields=['category', 'date_added'], name='product_category_date_added'),
+        ]
     
     def __str__(self):
         return self.name
@@ -46,19 +62,23 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse("product", kwargs={ "slug": self.slug})    
 
+    @property
+    def image_url(self):
+        return self.image.url
+
+    @property
+    def available(self):
+        return self.stock - self.reserved
+
     def get_rating(self):
-        rate_avg = Review.objects.filter(product=self).aggregate(average=Avg('rating'))
-        avg = 0
-        if rate_avg['average'] is not None:
-            avg = round(float(rate_avg['average']),1)
-        return avg
+        return round(self.rating_average, 1)
 
     def count_reviews(self):
-        counts = Review.objects.filter(product=self).aggregate(count=Count('id'))
-        count = 0
-        if counts['count'] is not None:
-            count = int(counts['count'])
-        return count
+        return self.rating_count
+
+    def get_rating_histogram(self):
+        # Review counts from 5 stars down to 1 star.
+        return [self.stars_5, self.stars_4, self.stars_3, self.stars_2, self.stars_1]
 
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -69,6 +89,12 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        unique_together = ('product', 'user')
+        indexes = [
+            models.Index(fields=['product', 'updated_at'], name='review_product_updated_at'),
+        ]
+
     def __str__(self):
         return self.subject
 
@@ -93,7 +119,15 @@ class CartProduct(models.Model):
     ordered = models.BooleanField(default=False)
     item = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    # True while the line is in a cart and NULL once ordered. NULLs never
+    # collide, so this allows one open line per user and product on MySQL too.
+    in_cart = models.BooleanField(default=True, null=True, editable=False)
+    # Prices at checkout, empty while the line is in a cart.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, editable=False)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
 
+    class Meta:
+        unique_together = ('user', 'item', 'in_cart')
 
     def __str__(self):
         return f"{self.quantity} of {self.item.name}"
@@ -107,7 +141,13 @@ class CartProduct(models.Model):
     def get_amount_saved(self):
         return self.get_total_item_price() - self.get_total_discount_item_price()
 
+    def get_unit_price(self):
+        price = self.item.discount_price or self.item.price
+        return decimal.Decimal(str(price)).quantize(decimal.Decimal('0.01'))
+
     def get_final_price(self):
+        if self.total_price is not None:
+            return self.total_price
         if self.item.discount_price:
             return round(self.get_total_discount_item_price(),2)
         return round(self.get_total_item_price(),2)
@@ -123,6 +163,19 @@ class Order(models.Model):
     received = models.BooleanField(default=False)
     refund_requested = models.BooleanField(default=False)
     refund_granted = models.BooleanField(default=False)
+    # Frozen at checkout.
+    total = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
+    # Counted in Cooccurrence by mine_associations.
+    mined = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # Stands in for (user, ordered). The ORM writes ordered=True as a
+            # bare boolean that SQLite and MySQL cannot seek on, so a third
+            # column after it would not serve the history sort. A user has
+            # few orders, and the history pages read them by date from here.
+            models.Index(fields=['user', 'date_ordered'], name='order_user_date_ordered'),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -131,6 +184,8 @@ class Order(models.Model):
         return self.items.all()
 
     def get_total(self):
+        if self.total is not None:
+            return self.total
         total = 0
         for order_item in self.items.all():
             total += order_item.get_final_price()
@@ -152,6 +207,53 @@ class Refund(models.Model):
         return f"{self.pk}"
 
 
+class LedgerEntry(models.Model):
+    OPENING = 'opening'
+    TOPUP = 'topup'
+    PURCHASE = 'purchase'
+    REFUND = 'refund'
+    KIND_CHOICES = (
+        (OPENING, 'Opening balance'),
+        (TOPUP, 'Top up'),
+        (PURCHASE, 'Purchase'),
+        (REFUND, 'Refund'),
+    )
+
+    user = models.ForeignKey(User, related_name='ledger_entries', on_delete=models.PROTECT)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Signed, purchases are negative.
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    order = models.ForeignKey(Order, blank=True, null=True, on_delete=models.PROTECT)
+    refund = models.OneToOneField(Refund, blank=True, null=True, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name_plural = 'ledger entries'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount} of user {self.user}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ledger entries cannot be changed.')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Ledger entries cannot be deleted.')
+
+
+class BalanceSnapshot(models.Model):
+    # The ledger sum of a user up to and including entry `last_entry_id`.
+    user = models.OneToOneField(User, related_name='balance_snapshot', on_delete=models.CASCADE)
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Balance {self.balance} of user {self.user} at entry {self.last_entry_id}"
+
+
 class Card(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
     name = models.CharField(max_length=60)
@@ -160,4 +262,96 @@ class Card(models.Model):
     expiry = models.CharField(max_length=15)
 
     def __str__(self):
-        return f"{self.user.username}'s card with number {self.number}"
\ No newline at end of file
+        return f"{self.user.username}'s card with number {self.number}"
+
+class Cooccurrence(models.Model):
+    # Number of ordered baskets containing both products. The diagonal
+    # (product == other) holds the number of baskets containing the product.
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    other = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    baskets = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+    def __str__(self):
+        return f"{self.product_id} & {self.other_id}: {self.baskets}"
+
+
+class Recommendation(models.Model):
+    product = models.ForeignKey(Product, related_name='recommendations', on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    support = models.FloatField()
+    confidence = models.FloatField()
+    lift = models.FloatField()
+
+    class Meta:
+        ordering = ('product', 'rank')
+        unique_together = ('product', 'rank')
+
+    def __str__(self):
+        return f"{self.product} -> {self.recommended}"
+
+
+class AssociationRun(models.Model):
+    baskets = models.IntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        get_latest_by = 'finished_at'
+
+    def __str__(self):
+        return f"Association run at {self.finished_at}"
+
+
+class PurchasedProduct(models.Model):
+    # One row per product a user has checked out, written by CheckoutView.
+    user = models.ForeignKey(User, related_name='purchased_products', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    first_purchased = models.DateTimeField(default=timezone.now)
+    last_purchased = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ('-last_purchased',)
+        unique_together = ('user', 'product')
+
+    def __str__(self):
+        return f"{self.user} purchased {self.product}"
+
+    @classmethod
+    def record(cls, user_id, product_ids):
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, product_id=pid, first_purchased=now, last_purchased=now) for pid in product_ids],
+            ignore_conflicts=True)
+        cls.objects.filter(user_id=user_id, product_id__in=product_ids).update(last_purchased=now)
+
+    @classmethod
+    def has_purchased(cls, user, product):
+        return user.is_authenticated and cls.objects.filter(user=user, product=product).exists()
+
+
+class LeaderboardEntry(models.Model):
+    # Best rated products of a category, maintained by store.leaderboards.
+    category = models.ForeignKey(Category, related_name='leaderboard', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ('category', 'rank')
+        unique_together = ('category', 'rank')
+        verbose_name_plural = "Leaderboard entries"
+
+    def __str__(self):
+        return f"{self.rank + 1}. {self.product} in {self.category}"
+
+
+class Reservation(models.Model):
+    line = models.OneToOneField(CartProduct, related_name='reservation', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product} until {self.expires_at}"
@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+
+
+def encode_cursor(direction, key):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    data = json.dumps([direction, *values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token, model, fields):
+    # Returns (direction, key) or None for a missing or tampered token. Key
+    # values go through their field, so a forged value never reaches a query.
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, *key = data
+        if direction not in ('next', 'previous') or len(key) != len(fields):
+            return None
+        key = [model._meta.get_field(f).to_python(v) for f, v in zip(fields, key)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+    # With USE_TZ, issued tokens carry aware datetimes.
+    naive = settings.USE_TZ and any(isinstance(v, datetime) and timezone.is_naive(v) for v in key)
+    if None in key or naive:
+        return None
+    return direction, key
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def seek(fields, key, forward):
+    # Rows after `key` in (fields) descending order, or before it when going back.
+    lookup = 'lt' if forward else 'gt'
+    condition = Q()
+    for i in range(len(fields) - 1, -1, -1):
+        step = Q(**{f'{fields[i]}__{lookup}': key[i]})
+        condition = step | (Q(**{fields[i]: key[i]}) & condition) if condition else step
+    return condition
+
+
+def page_query(queryset, fields, cursor, per_page):
+    # The one query behind a page, with a row more to tell whether one follows.
+    forward = cursor is None or cursor[0] == 'next'
+    if cursor is not None:
+        queryset = queryset.filter(seek(fields, cursor[1], forward))
+    ordering = [f'-{f}' if forward else f for f in fields]
+    return queryset.order_by(*ordering)[:per_page + 1]
+
+
+def cursor_paginate(queryset, fields, token, per_page):
+    # Keyset pagination over `fields` in descending order, the last field has
+    # to be unique. Every page costs one query without COUNT or OFFSET.
+    def key_of(row):
+        return [row[f] if isinstance(row, dict) else getattr(row, f) for f in fields]
+
+    cursor = decode_cursor(token, queryset.model, fields)
+    forward = cursor is None or cursor[0] == 'next'
+    rows = list(page_query(queryset, fields, cursor, per_page))
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if more or not forward:
+            next_cursor = encode_cursor('next', key_of(rows[-1]))
+        if cursor is not None and (forward or more):
+            previous_cursor = encode_cursor('previous', key_of(rows[0]))
+    return CursorPage(rows, next_cursor, previous_cursor)
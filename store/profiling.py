@@ -0,0 +1,127 @@
+import asyncio
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+
+PROFILE_EXTENSIONS = ('.prof', '.folded')
+
+
+class StackSampler:
+    # Samples one thread's Python stack from a background thread and counts
+    # the stacks in the folded format flamegraph.pl and speedscope read.
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.done = threading.Event()
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def run(self, func, *args):
+        thread = threading.Thread(target=self.sample, daemon=True)
+        thread.start()
+        try:
+            return func(*args)
+        finally:
+            self.done.set()
+            thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def requested_mode(request):
+    # Returns (mode, asked). Staff ask with ?profile=cprofile|sample or an
+    # X-Profile header, other requests are only sampled at random.
+    mode = request.GET.get('profile') or request.headers.get('X-Profile')
+    if mode and request.user.is_staff:
+        return 'sample' if mode == 'sample' else 'cprofile', True
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return 'sample', False
+    return None, False
+
+
+def list_profiles():
+    directory = settings.PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(PROFILE_EXTENSIONS)]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return entries
+
+
+def rotate():
+    for entry in list_profiles()[settings.PROFILE_KEEP:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    # Has to come after AuthenticationMiddleware to see staff users.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        mode, asked = requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return self.profile(request, mode, asked, self.get_response)
+
+    async def acall(self, request):
+        # The staff check can load the user, which the event loop must not do.
+        mode, asked = await sync_to_async(requested_mode)(request)
+        if mode is None:
+            return await self.get_response(request)
+        # Profiled requests run in one thread so the profiler sees the view.
+        return await sync_to_async(self.profile)(request, mode, asked, async_to_sync(self.get_response))
+
+    def profile(self, request, mode, asked, get_response):
+        start = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(get_response, request)
+        else:
+            profiler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL)
+            response = profiler.run(get_response, request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        view = match.view_name.replace(':', '-') if match else 'unresolved'
+        extension = '.prof' if mode == 'cprofile' else '.folded'
+        name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{view}-{elapsed:.0f}ms{extension}'
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        if mode == 'cprofile':
+            profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+        else:
+            profiler.dump(os.path.join(settings.PROFILE_DIR, name))
+        rotate()
+        # Only staff who asked learn the file, sampled visitors see nothing.
+        if asked:
+            response['X-Profile-File'] = name
+        return response
@@ -0,0 +1,75 @@
+from django.db import connection
+from .cart import cart_lines, open_orders, shown_lines
+from .leaderboards import best_rated_entries
+from .listings import LISTING_ORDER, LISTING_PER_PAGE, card_rows, listing_products
+from .models import Product, PurchasedProduct, Review
+from .pagination import page_query
+from .views import (
+    ORDER_HISTORY_ORDER, ORDERS_PER_PAGE, REVIEW_ORDER, REVIEWS_PER_PAGE, order_history, product_recommendations,
+    product_reviews,
+)
+
+# Querysets behind the busiest views, built from sample rows with the same
+# functions the views use. Each one should be answered from an index without
+# scanning or sorting a whole table.
+HOT_QUERIES = {
+    'product by slug': lambda s: Product.objects.filter(slug=s['product'].slug),
+    'home listing': lambda s: page_query(card_rows(listing_products()), LISTING_ORDER, None, LISTING_PER_PAGE),
+    'category listing': lambda s: page_query(
+        card_rows(listing_products(s['category'])), LISTING_ORDER, None, LISTING_PER_PAGE),
+    'review page': lambda s: page_query(product_reviews(s['product'].pk), REVIEW_ORDER, None, REVIEWS_PER_PAGE),
+    'own review': lambda s: Review.objects.filter(product=s['product'], user=s['user']),
+    'open order': lambda s: open_orders(s['user']),
+    'cart lines': lambda s: shown_lines(s['user']),
+    'cart line': lambda s: cart_lines(s['user']).filter(item=s['product']),
+    'order history': lambda s: page_query(order_history(s['user']), ORDER_HISTORY_ORDER, None, ORDERS_PER_PAGE),
+    'recommendations': lambda s: product_recommendations(s['product']),
+    'best rated': lambda s: best_rated_entries(s['category'].pk),
+    'purchased check': lambda s: PurchasedProduct.objects.filter(user=s['user'], product=s['product']),
+}
+
+
+def get_samples():
+    review = Review.objects.select_related('product__category', 'user').first()
+    if review is None:
+        return None
+    return {'product': review.product, 'category': review.product.category, 'user': review.user}
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def find_problems(plan):
+    problems = []
+    for row in plan:
+        if connection.vendor == 'mysql':
+            if row['type'] == 'ALL':
+                problems.append(f"full scan of {row['table']}")
+            if 'filesort' in (row['Extra'] or ''):
+                problems.append(f"filesort on {row['table']}")
+        elif connection.vendor == 'sqlite':
+            detail = row['detail']
+            if detail.startswith('SCAN') and ' USING ' not in detail:
+                problems.append(detail.lower())
+            if 'TEMP B-TREE' in detail:
+                problems.append(detail.lower())
+        else:
+            line = next(iter(row.values()))
+            if 'Seq Scan' in line or line.strip(' ->').startswith('Sort '):
+                problems.append(line.strip(' ->'))
+    return problems
+
+
+def audit(samples, names=None):
+    # Yields (name, plan rows, problems) for every registered query.
+    for name, build in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        plan = explain(build(samples))
+        yield name, plan, find_problems(plan)
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+from .models import Product, Review
+
+STAR_FIELDS = {i: f'stars_{i}' for i in range(1, 6)}
+
+
+def average_expression():
+    total = sum(F(field) * i for i, field in STAR_FIELDS.items())
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast(total, FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating(product_id, rating, delta):
+    # delta is 1 when a review with this rating is added and -1 when removed.
+    field = STAR_FIELDS.get(rating)
+    if field is None:
+        return
+    products = Product.objects.filter(pk=product_id)
+    with transaction.atomic():
+        products.update(**{
+            field: F(field) + delta,
+            'rating_count': F('rating_count') + delta,
+        })
+        # The first update holds the row lock, so this reads the new counts.
+        products.update(rating_average=average_expression())
+
+
+def rebuild_ratings(batch_size=1000):
+    counts = {
+        row.pop('product_id'): row
+        for row in Review.objects.values('product_id').annotate(**{
+            field: Count('id', filter=Q(rating=i)) for i, field in STAR_FIELDS.items()
+        })
+    }
+
+    fields = ['rating_average', 'rating_count', *STAR_FIELDS.values()]
+    changed = []
+    rebuilt = 0
+    with transaction.atomic():
+        for product in Product.objects.only('id', *fields).iterator(chunk_size=batch_size):
+            stars = counts.get(product.id, {})
+            product.rating_count = 0
+            total = 0
+            for i, field in STAR_FIELDS.items():
+                setattr(product, field, stars.get(field, 0))
+                product.rating_count += stars.get(field, 0)
+                total += stars.get(field, 0) * i
+            product.rating_average = total / product.rating_count if product.rating_count else 0
+            changed.append(product)
+            if len(changed) >= batch_size:
+                Product.objects.bulk_update(changed, fields)
+                rebuilt += len(changed)
+                changed = []
+        Product.objects.bulk_update(changed, fields)
+    return rebuilt + len(changed)
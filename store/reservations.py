@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+from .models import Product, Reservation
+
+# Every path that changes reservations locks the product rows first, so the
+# Product.reserved counter always matches the reservation rows.
+
+
+def lock_products(product_ids):
+    return dict(Product.objects.select_for_update().filter(
+        id__in=product_ids).order_by('id').values_list('id', 'stock'))
+
+
+def release_rows(reservations):
+    held = dict(reservations.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+    reservations.delete()
+    if held:
+        Product.objects.filter(id__in=held).update(reserved=F('reserved') - Case(
+            *[When(id=pid, then=Value(quantity)) for pid, quantity in held.items()],
+            output_field=IntegerField(),
+        ), updated_at=Now())
+    return sum(held.values())
+
+
+def reserve(line, quantity):
+    # Holds `quantity` of the line's product for the line, replacing what it
+    # held before. Returns False when not enough is available.
+    with transaction.atomic():
+        lock_products([line.item_id])
+        release_rows(Reservation.objects.filter(product_id=line.item_id, expires_at__lte=timezone.now()))
+        product = Product.objects.only('stock', 'reserved').get(pk=line.item_id)
+        reservation = Reservation.objects.filter(line=line).first()
+        held = reservation.quantity if reservation else 0
+        if quantity > product.available + held:
+            return False
+
+        expires_at = timezone.now() + timedelta(seconds=settings.RESERVATION_TTL)
+        if reservation is None:
+            Reservation.objects.create(line=line, product_id=line.item_id, quantity=quantity, expires_at=expires_at)
+        else:
+            Reservation.objects.filter(pk=reservation.pk).update(quantity=quantity, expires_at=expires_at)
+        Product.objects.filter(pk=line.item_id).update(reserved=F('reserved') + quantity - held, updated_at=Now())
+    return True
+
+
+def release(line):
+    with transaction.atomic():
+        lock_products([line.item_id])
+        release_rows(Reservation.objects.filter(line=line))
+
+
+def release_expired(batch_size=500):
+    released = 0
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            product_ids = set(Reservation.objects.filter(expires_at__lte=now).values_list(
+                'product_id', flat=True)[:batch_size])
+            if not product_ids:
+                return released
+            lock_products(product_ids)
+            expired = Reservation.objects.filter(product_id__in=product_ids, expires_at__lte=now)
+            released += release_rows(expired)
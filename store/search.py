@@ -0,0 +1,166 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Category, Product
+
+# Turkish dotted/dotless i first, then letters users often type without accents.
+TURKISH_LOWER = str.maketrans({'I': 'ı', 'İ': 'i'})
+ASCII_FOLD = str.maketrans('ıçğöşüâîû', 'icgosuaiu')
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    return text.translate(TURKISH_LOWER).lower().translate(ASCII_FOLD)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text or ''))
+
+
+class InvertedIndexBackend:
+    # In-process index of product name, category title and description.
+    # Every query term matches as a prefix and all terms have to match.
+    FIELD_WEIGHTS = (('name', 3.0), ('category__title', 2.0), ('description', 1.0))
+    VERSION_KEY = 'search:version'
+    max_results = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = None
+        self.version = None
+
+    def build(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        fields = [field for field, _ in self.FIELD_WEIGHTS]
+        for row in Product.objects.values('id', *fields).iterator():
+            self.add(row)
+        self.terms = sorted(self.postings)
+
+    def add(self, row):
+        weights = defaultdict(float)
+        for field, weight in self.FIELD_WEIGHTS:
+            for term in tokenize(row[field]):
+                weights[term] += weight
+        for term, weight in weights.items():
+            self.postings[term][row['id']] = weight
+        self.doc_terms[row['id']] = set(weights)
+
+    def update(self, product_ids):
+        if self.postings is None:
+            return
+        fields = [field for field, _ in self.FIELD_WEIGHTS]
+        rows = list(Product.objects.filter(id__in=product_ids).values('id', *fields))
+        with self.lock:
+            for pid in product_ids:
+                for term in self.doc_terms.pop(pid, ()):
+                    del self.postings[term][pid]
+                    if not self.postings[term]:
+                        del self.postings[term]
+            for row in rows:
+                self.add(row)
+            self.terms = sorted(self.postings)
+
+    def ensure_current(self):
+        # Saves in other worker processes bump the shared version.
+        version = cache.get(self.VERSION_KEY, 0)
+        if self.postings is None or version != self.version:
+            with self.lock:
+                if self.postings is None or version != self.version:
+                    self.build()
+                    self.version = version
+
+    def expand(self, prefix):
+        start = bisect_left(self.terms, prefix)
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def rank(self, query):
+        self.ensure_current()
+        # update() edits the postings in place, searches wait for it. Ranking
+        # is pure Python, so under the GIL the lock costs no parallelism.
+        with self.lock:
+            return self.rank_locked(query)
+
+    def rank_locked(self, query):
+        scores = None
+        total = len(self.doc_terms) or 1
+        for prefix in set(tokenize(query)):
+            matched = defaultdict(float)
+            for term in self.expand(prefix):
+                docs = self.postings[term]
+                idf = math.log(1 + total / len(docs))
+                for pid, weight in docs.items():
+                    # Exact terms rank above longer words sharing the prefix.
+                    matched[pid] = max(matched[pid], weight * idf * len(prefix) / len(term))
+            if scores is None:
+                scores = matched
+            else:
+                scores = {pid: score + matched[pid] for pid, score in scores.items() if pid in matched}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores, key=lambda pid: (-scores[pid], -pid))[:self.max_results]
+
+    def search(self, query, products):
+        ids = self.rank(query)
+        order = Case(*[When(id=pid, then=i) for i, pid in enumerate(ids)], output_field=IntegerField())
+        return products.filter(id__in=ids).order_by(order) if ids else products.none()
+
+    def changed(self, product_ids):
+        self.update(product_ids)
+        try:
+            version = cache.incr(self.VERSION_KEY)
+        except ValueError:
+            version = 1
+            cache.set(self.VERSION_KEY, version, None)
+        # Skip the rebuild only when no other process changed the catalog.
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+
+
+class MySQLFullTextBackend:
+    # Needs the FULLTEXT indexes created by migration 0013 on MySQL. Case and
+    # accent folding follow the column collation.
+    MATCH_PRODUCT = "MATCH (store_product.name, store_product.description) AGAINST (%s IN BOOLEAN MODE)"
+    MATCH_CATEGORY = "MATCH (title) AGAINST (%s IN BOOLEAN MODE)"
+
+    def boolean_query(self, query):
+        return ' '.join(f'+{term}*' for term in TOKEN_RE.findall(query.lower()))
+
+    def search(self, query, products):
+        terms = self.boolean_query(query)
+        if not terms:
+            return products.none()
+        categories = Category.objects.annotate(
+            search_rank=RawSQL(self.MATCH_CATEGORY, [terms])).filter(search_rank__gt=0)
+        return products.annotate(
+            search_rank=RawSQL(self.MATCH_PRODUCT, [terms]),
+        ).filter(Q(search_rank__gt=0) | Q(category__in=categories.values('id'))).order_by('-search_rank', '-date_added')
+
+    def changed(self, product_ids):
+        pass
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings, 'SEARCH_BACKEND', 'store.search.InvertedIndexBackend'))()
+    return _backend
+
+
+def search(query, products):
+    return get_backend().search(query, products)
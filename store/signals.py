@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from .models import Category, LeaderboardEntry, Product, Refund, Review
+from .caching import bump_catalog_version
+from .images import generate_uploaded
+from .leaderboards import product_rating_changed, refresh_leaderboard
+from .metrics import record_query
+from .ratings import apply_rating
+from .search import get_backend
+from .wallet import credit_refund
+
+
+@receiver(post_init, sender=Review)
+def remember_rating(sender, instance, **kwargs):
+    # Saved state, so an update can take back the rating it replaces.
+    instance._saved_rating = (instance.product_id, instance.rating) if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    with transaction.atomic():
+        if instance._saved_rating is not None:
+            apply_rating(*instance._saved_rating, -1)
+        apply_rating(instance.product_id, instance.rating, 1)
+        product_rating_changed(instance.product_id)
+        if instance._saved_rating is not None and instance._saved_rating[0] != instance.product_id:
+            product_rating_changed(instance._saved_rating[0])
+    instance._saved_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    if instance._saved_rating is not None:
+        with transaction.atomic():
+            apply_rating(*instance._saved_rating, -1)
+            product_rating_changed(instance._saved_rating[0])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_backend().changed([instance.pk]))
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    # A product moved to another category leaves its old board.
+    moved = LeaderboardEntry.objects.filter(product=instance).exclude(category_id=instance.category_id)
+    for category_id in set(moved.values_list('category_id', flat=True)):
+        refresh_leaderboard(category_id)
+    product_rating_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    category_id = instance.category_id
+    transaction.on_commit(lambda: refresh_leaderboard(category_id))
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    product_ids = list(instance.products.values_list('id', flat=True))
+    transaction.on_commit(lambda: get_backend().changed(product_ids))
+
+
+def image_name(instance):
+    # Deferred fields are missing from __dict__, reading them would query.
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=Product)
+def remember_image(sender, instance, **kwargs):
+    instance._saved_image = image_name(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def image_saved(sender, instance, **kwargs):
+    # Variants of the shared default image come from generate_image_derivatives.
+    name = image_name(instance)
+    if name and name != instance._saved_image and name != Product._meta.get_field('image').default:
+        instance._saved_image = name
+        transaction.on_commit(lambda: generate_uploaded(name))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Refund)
+def refund_saved(sender, instance, **kwargs):
+    # Accepting a refund in the admin credits the wallet payment back once.
+    if instance.accepted:
+        credit_refund(instance)
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Text files worth precompressing, images and woff fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.eot', '.ttf', '.otf')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+HASHED_RE = re.compile(r'\.[0-9a-f]{12}(\.[^./]+)$')
+
+
+def compressors():
+    yield '.gz', lambda data: gzip.compress(data, 9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # collectstatic writes content-hashed copies, staticfiles.json and a .gz
+    # (and .br when brotli is installed) next to every hashed text file.
+
+    def stored_name(self, name):
+        # Without a manifest, before the first collectstatic, pages link the
+        # plain names as in development.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        # Hashed names never change content, an existing copy is current.
+        path = self.path(name)
+        data = None
+        for suffix, compress in compressors():
+            if os.path.exists(path + suffix):
+                continue
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            packed = compress(data)
+            if len(packed) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(packed)
+
+
+def is_hashed(name):
+    unhashed = HASHED_RE.sub(r'\1', name)
+    return unhashed != name and getattr(staticfiles_storage, 'hashed_files', {}).get(unhashed) == name
+
+
+def accepted_encodings(request):
+    return {value.split(';')[0].strip() for value in request.headers.get('Accept-Encoding', '').split(',')}
+
+
+def serve(request, path):
+    # Serves STATIC_ROOT when no web server sits in front of the app. Hashed
+    # names are cached for a year, the precompressed copy is sent when the
+    # client accepts it.
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full):
+        raise Http404
+    stat = os.stat(full)
+    immutable = is_hashed(name)
+    if not immutable and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+    encoding = None
+    accepted = accepted_encodings(request)
+    for candidate, suffix in ENCODINGS:
+        if candidate in accepted and os.path.isfile(full + suffix):
+            encoding = candidate
+            full += suffix
+            break
+    response = FileResponse(open(full, 'rb'), content_type=content_type)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if name.endswith(COMPRESSIBLE):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if immutable:
+        patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0)
+    return response
+
+
+class PreloadMiddleware:
+    # Link headers on HTML pages, so the browser (or a proxy sending 103
+    # Early Hints) starts on the critical CSS and JS before parsing the page.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.links = None
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks __call__ as returning a coroutine, like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        return self.add_links(self.get_response(request))
+
+    async def acall(self, request):
+        return self.add_links(await self.get_response(request))
+
+    def add_links(self, response):
+        if response.status_code != 200 or not response.get('Content-Type', '').startswith('text/html'):
+            return response
+        if self.links is None:
+            # The manifest is read once per process, so are the hashed URLs.
+            self.links = ', '.join(f'<{static(path)}>; rel=preload; as={kind}'
+                                   for path, kind in settings.PRELOAD_ASSETS)
+        if self.links:
+            response['Link'] = f'{response["Link"]}, {self.links}' if response.has_header('Link') else self.links
+        return response
@@ -0,0 +1,17 @@
+from django import template
+from django.template.loader import render_to_string
+from store import images
+from store.caching import card_key, get_catalog_version, get_or_render
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def product_card(context, item):
+    version = context.get('catalog_version') or get_catalog_version()
+    return get_or_render('card', card_key(version, item.id),
+                         lambda: render_to_string('includes/product_card.html', {'item': item}))
+
+
+@register.simple_tag
+def srcset(image, fmt='jpeg'):
+    return images.srcset(image, fmt)
@@ -1,3 +1,773 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from cities_light.models import Country, Region
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, DatabaseError
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+from .associations import mine_associations
+from .cart import add_line, get_cart_store, NotAvailable, upsert_line
+from . import images, wallet
+from .checkout import checkout, CheckoutError
+from .cooccurrence import CooccurrenceEngine, get_associated
+from .leaderboards import get_best_rated
+from .models import (
+    Address, Balance, Card, CartProduct, Category, LedgerEntry, Order, Product, Recommendation, Refund,
+    Reservation, Review,
+)
+from .pagination import cursor_paginate, encode_cursor
+from .search import InvertedIndexBackend, MySQLFullTextBackend
 
-# Create your tests here.
+
+class CheckoutConcurrencyTest(TransactionTestCase):
+    buyers = 20
+    stock = 5
+
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.product = Product.objects.create(
+            name='Pen', price=10, description='', slug='pen', stock=self.stock, category=category)
+        self.orders = []
+        for i in range(self.buyers):
+            user = User.objects.create(username=f'buyer{i}')
+            Balance.objects.create(user=user, balance=100)
+            line = CartProduct.objects.create(user=user, item=self.product, quantity=1)
+            order = Order.objects.create(user=user, date_ordered=timezone.now())
+            order.items.add(line)
+            self.orders.append(order)
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        placed = []
+        start = threading.Barrier(self.buyers)
+
+        def buy(order):
+            try:
+                start.wait()
+                # SQLite locks the whole database, a locked buyer tries again.
+                for _ in range(50):
+                    try:
+                        checkout(order, None, pay_with_wallet=True)
+                        placed.append(order.pk)
+                        break
+                    except DatabaseError:
+                        time.sleep(0.02)
+            except CheckoutError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(order,)) for order in self.orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertGreater(len(placed), 0)
+        self.assertLessEqual(len(placed), self.stock)
+        self.assertEqual(self.product.stock, self.stock - len(placed))
+        self.assertEqual(Order.objects.filter(ordered=True).count(), len(placed))
+        self.assertEqual(Balance.objects.filter(balance=90).count(), len(placed))
+        self.assertEqual(LedgerEntry.objects.filter(kind=LedgerEntry.PURCHASE, amount=-10).count(), len(placed))
+
+
+@override_settings(
+    CART_STORE='store.cart.CacheCartStore',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'carts'}},
+)
+class CacheCartStoreTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.pen = Product.objects.create(name='Pen', price=10, description='', slug='pen', stock=3, category=category)
+        self.ink = Product.objects.create(name='Ink', price=4, description='', slug='ink', stock=9, category=category)
+        self.user = User.objects.create(username='buyer')
+        Balance.objects.create(user=self.user, balance=100)
+        self.cart_store = get_cart_store()
+
+    def test_cart_stays_out_of_the_database_until_checkout(self):
+        self.assertEqual(self.cart_store.add(self.user, self.pen, 2), (True, False))
+        self.assertEqual(self.cart_store.add(self.user, self.pen, 2), (False, True))
+        self.cart_store.add(self.user, self.ink, 1)
+        self.cart_store.set_quantity(self.user, self.ink, 4)
+        self.assertEqual(CartProduct.objects.count(), 0)
+        self.assertEqual(Order.objects.count(), 0)
+
+        cart = self.cart_store.get_cart(self.user)
+        self.assertEqual(self.cart_store.count(self.user), 2)
+        self.assertEqual(cart.get_total(), 46)
+
+        order = self.cart_store.get_order(self.user)
+        self.assertEqual(sorted(order.items.values_list('item__name', 'quantity')), [('Ink', 4), ('Pen', 3)])
+        checkout(order, None, pay_with_wallet=True)
+        self.cart_store.clear(self.user)
+        self.assertEqual(self.cart_store.count(self.user), 0)
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 54)
+
+    def test_flush_persists_carts(self):
+        self.cart_store.add(self.user, self.pen, 1)
+        self.assertEqual(self.cart_store.flush(older_than=3600), 0)
+        self.assertEqual(CartProduct.objects.count(), 0)
+        self.assertEqual(self.cart_store.flush(), 1)
+        self.assertEqual(list(CartProduct.objects.values_list('item__name', 'quantity')), [('Pen', 1)])
+
+        self.cart_store.remove(self.user, self.pen)
+        self.assertEqual(self.cart_store.flush(), 1)
+        self.assertEqual(CartProduct.objects.count(), 0)
+
+
+
+class DatabaseCartStoreTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.pen = Product.objects.create(name='Pen', price=10, description='', slug='pen', stock=3, category=category)
+        self.user = User.objects.create(username='buyer')
+
+    def lines(self):
+        return list(CartProduct.objects.filter(user=self.user, in_cart=True).values_list('quantity', flat=True))
+
+    def test_repeated_adds_share_one_line_in_the_open_order(self):
+        self.assertEqual(upsert_line(self.user, self.pen, 1), (True, False))
+        self.assertEqual(upsert_line(self.user, self.pen, 1), (False, False))
+        self.assertEqual(self.lines(), [2])
+        order = get_cart_store().get_order(self.user)
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [2])
+
+    def test_losing_the_create_race_adds_to_the_winning_line(self):
+        upsert_line(self.user, self.pen, 1)
+        # The UPDATE of a concurrent request ran before this line existed.
+        lines = CartProduct.objects.filter(user=self.user, item=self.pen, in_cart=True)
+        self.assertEqual(add_line(self.user, self.pen, 1, lines), (False, False))
+        self.assertEqual(self.lines(), [2])
+        self.assertEqual(Order.items.through.objects.count(), 1)
+
+    def test_quantity_is_capped_at_stock(self):
+        self.assertEqual(upsert_line(self.user, self.pen, 2), (True, False))
+        self.assertEqual(upsert_line(self.user, self.pen, 2), (False, True))
+        self.assertEqual(self.lines(), [3])
+
+        other = User.objects.create(username='other')
+        self.assertEqual(upsert_line(other, self.pen, 5), (True, True))
+        self.assertEqual(CartProduct.objects.get(user=other).quantity, 3)
+
+
+@override_settings(STOCK_RESERVATIONS=True)
+class ReservationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.pen = Product.objects.create(name='Pen', price=10, description='', slug='pen', stock=3, category=category)
+        self.user = User.objects.create(username='buyer')
+        self.other = User.objects.create(username='other')
+        self.cart_store = get_cart_store()
+
+    def assertReserved(self, reserved, rows):
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.reserved, reserved)
+        self.assertEqual(Reservation.objects.count(), rows)
+
+    def expire(self):
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_a_line_holds_its_quantity_once(self):
+        self.cart_store.add(self.user, self.pen, 2)
+        self.cart_store.add(self.user, self.pen, 1)
+        self.assertReserved(3, 1)
+        self.cart_store.set_quantity(self.user, self.pen, 1)
+        self.assertReserved(1, 1)
+
+        self.cart_store.add(self.other, self.pen, 2)
+        with self.assertRaises(NotAvailable):
+            self.cart_store.add(self.other, self.pen, 1)
+        self.assertReserved(3, 2)
+        self.assertEqual(CartProduct.objects.get(user=self.other).quantity, 2)
+
+        self.cart_store.remove(self.user, self.pen)
+        self.assertReserved(2, 1)
+
+    def test_expired_holds_go_back_on_sale(self):
+        self.cart_store.add(self.user, self.pen, 3)
+        self.expire()
+        self.cart_store.add(self.other, self.pen, 2)
+        self.assertReserved(2, 1)
+
+        self.expire()
+        out = StringIO()
+        call_command('release_reservations', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Released 2 reserved items.')
+        self.assertReserved(0, 0)
+
+    def test_checkout_counts_the_buyers_own_hold(self):
+        self.cart_store.add(self.user, self.pen, 3)
+        self.assertEqual(Product.objects.get(pk=self.pen.pk).available, 0)
+        checkout(self.cart_store.get_order(self.user), None)
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.stock, 0)
+        self.assertReserved(0, 0)
+
+# Most queries a GET of each named URL may run, measured logged in as staff
+# with a cold cache. A new URL fails the test until it gets a budget here.
+QUERY_BUDGETS = {
+    'profiles': 2,
+    'home': 4,
+    'contact': 2,
+    'product': 8,
+    'signup': 2,
+    'login': 2,
+    'password_reset': 2,
+    'password_reset_done': 2,
+    'password_reset_confirm': 5,
+    'password_reset_complete': 2,
+    'password_change': 2,
+    'password_change_done': 2,
+    'my_account': 4,
+    'change_settings': 2,
+    'add_address': 4,
+    'ajax_load_subregions': 3,
+    'ajax_reviews': 1,
+    'cart': 6,
+    'checkout': 6,
+    'orders': 4,
+    'refund': 4,
+    'wallet': 4,
+    'addcard': 2,
+    'cache_stats': 2,
+    'metrics': 2,
+    'api_products': 1,
+    'api_product': 2,
+    'api_reviews': 1,
+    'api_cart': 3,
+    'category_home': 4,
+}
+
+# URLs that are not measured, with the reason.
+UNMEASURED = {
+    'profile_download': 'serves a file from PROFILE_DIR',
+    'logout': 'ends the session',
+    'delete_address': 'deletes on GET',
+}
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize(sql):
+    # The same statement with different values counts as a repeat.
+    return LITERAL_RE.sub('?', sql)
+
+
+def repeated_queries(queries):
+    counts = Counter(normalize(query['sql']) for query in queries)
+    return [f'{n}x {sql}' for sql, n in counts.most_common() if n > 1]
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budgets'}})
+class QueryBudgetTest(TestCase):
+    # Every view is measured at each size. Query counts have to stay the same
+    # as the data grows, a growing count is an N+1 somewhere.
+    sizes = (1, 3, 6)
+
+    def setUp(self):
+        country = Country.objects.create(name='Turkey', code2='TR', code3='TUR', continent='AS', tld='tr', geoname_id=1)
+        self.region = Region.objects.create(name='Izmir', country=country, geoname_id=2)
+        self.category = Category.objects.create(title='Pens', slug='pens')
+        self.user = User.objects.create(username='staff', is_staff=True, is_superuser=True)
+        Balance.objects.create(user=self.user, balance=1000)
+        self.product = self.add_product()
+        self.order = None
+        self.size = 0
+
+    def add_product(self):
+        n = Product.objects.count()
+        return Product.objects.create(
+            name=f'Pen {n}', price=10, description='A pen', slug=f'pen-{n}', stock=100, category=self.category)
+
+    def grow(self, size):
+        # Adds one more of everything a page lists per step.
+        for _ in range(size - self.size):
+            product = self.add_product()
+            Recommendation.objects.create(product=self.product, recommended=product, rank=Product.objects.count(),
+                                          support=0.1, confidence=0.5, lift=2)
+            reviewer = User.objects.create(username=f'reviewer{Product.objects.count()}')
+            Review.objects.create(product=self.product, user=reviewer, subject='Good', comment='A good pen', rating=4)
+            Review.objects.create(product=product, user=reviewer, subject='Fine', comment='', rating=3)
+            address = Address.objects.create(user=self.user, address='Street', region=self.region, zip='35000')
+            Card.objects.create(user=self.user, name='Card', cvc='000', expiry='01/30')
+            get_cart_store().add(self.user, product, 1)
+
+            self.order = Order.objects.create(
+                user=self.user, ordered=True, shipping_address=address, date_ordered=timezone.now(), total=20)
+            for item in (product, self.product):
+                self.order.items.add(CartProduct.objects.create(
+                    user=self.user, item=item, ordered=True, in_cart=None, unit_price=10, total_price=10))
+        self.size = size
+
+    def url_kwargs(self):
+        return {
+            'product': {'slug': self.product.slug},
+            'password_reset_confirm': {
+                'uidb64': urlsafe_base64_encode(force_bytes(self.user.pk)),
+                'token': default_token_generator.make_token(self.user),
+            },
+            'refund': {'pk': self.order.pk},
+            'api_product': {'slug': self.product.slug},
+            'api_reviews': {'slug': self.product.slug},
+            'category_home': {'slug': self.category.slug},
+        }
+
+    def url_params(self):
+        return {
+            'ajax_load_subregions': f'?region_id={self.region.pk}',
+            'ajax_reviews': f'?product_id={self.product.pk}',
+        }
+
+    def named_urls(self):
+        return [pattern.name for pattern in get_resolver().url_patterns
+                if isinstance(pattern, URLPattern) and pattern.name]
+
+    def measure(self, name):
+        url = reverse(name, kwargs=self.url_kwargs().get(name)) + self.url_params().get(name, '')
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, f'GET {url} returned {response.status_code}')
+        return queries.captured_queries
+
+    def test_every_url_has_a_budget(self):
+        names = set(self.named_urls())
+        self.assertEqual(names - set(QUERY_BUDGETS) - set(UNMEASURED), set(), 'URLs without a query budget')
+        self.assertEqual(set(QUERY_BUDGETS) - names, set(), 'Budgets of URLs that do not exist')
+
+    def test_queries_stay_flat_and_within_budget(self):
+        self.client.force_login(self.user)
+        counts = {}
+        for size in self.sizes:
+            self.grow(size)
+            for name in QUERY_BUDGETS:
+                queries = self.measure(name)
+                counts.setdefault(name, []).append(len(queries))
+                with self.subTest(url=name, size=size):
+                    report = '\n'.join(repeated_queries(queries)) or 'no repeated statements'
+                    self.assertLessEqual(
+                        len(queries), QUERY_BUDGETS[name],
+                        f'{name} ran {len(queries)} queries, budget {QUERY_BUDGETS[name]}. Repeated:\n{report}')
+                    self.assertEqual(
+                        len(queries), counts[name][0],
+                        f'{name} queries grow with the data {counts[name]}. Repeated:\n{report}')
+
+
+class RatingSignalTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Pens', slug='pens')
+        self.pen = Product.objects.create(name='Pen', price=10, description='', slug='pen', category=self.category)
+        self.ink = Product.objects.create(name='Ink', price=4, description='', slug='ink', category=self.category)
+        self.users = [User.objects.create(username=f'reviewer{i}') for i in range(3)]
+
+    def assertRating(self, product, count, average, **stars):
+        product.refresh_from_db()
+        self.assertEqual(product.rating_count, count)
+        self.assertAlmostEqual(product.rating_average, average)
+        for i in range(1, 6):
+            self.assertEqual(getattr(product, f'stars_{i}'), stars.get(f'stars_{i}', 0))
+
+    def test_review_writes_keep_the_aggregates_current(self):
+        first = Review.objects.create(product=self.pen, user=self.users[0], rating=5)
+        Review.objects.create(product=self.pen, user=self.users[1], rating=2)
+        self.assertRating(self.pen, 2, 3.5, stars_5=1, stars_2=1)
+
+        first.rating = 3
+        first.save()
+        self.assertRating(self.pen, 2, 2.5, stars_3=1, stars_2=1)
+
+        first.product = self.ink
+        first.save()
+        self.assertRating(self.pen, 1, 2.0, stars_2=1)
+        self.assertRating(self.ink, 1, 3.0, stars_3=1)
+        self.assertEqual(get_best_rated(self.category.pk), [self.ink, self.pen])
+
+        first.delete()
+        self.assertRating(self.ink, 0, 0.0)
+        self.assertEqual(get_best_rated(self.category.pk), [self.pen, self.ink])
+
+    def test_admin_edits_keep_the_aggregates_current(self):
+        review = Review.objects.create(product=self.pen, user=self.users[0], subject='Good', rating=4)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+
+        response = self.client.post(reverse('admin:store_review_change', args=[review.pk]), {
+            'product': self.ink.pk, 'user': self.users[0].pk, 'subject': 'Good', 'comment': '', 'rating': 1,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertRating(self.pen, 0, 0.0)
+        self.assertRating(self.ink, 1, 1.0, stars_1=1)
+
+        response = self.client.post(reverse('admin:store_review_delete', args=[review.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertRating(self.ink, 0, 0.0)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.products = [
+            Product.objects.create(name=f'Pen {i}', price=10, description='', slug=f'pen-{i}', category=category)
+            for i in range(5)
+        ]
+        user = User.objects.create(username='reviewer')
+        Review.objects.create(product=self.products[0], user=user, subject='Good', comment='A good pen')
+
+    def test_pages_walk_forward_and_back(self):
+        products = Product.objects.all()
+        page = cursor_paginate(products, ('date_added', 'id'), None, 2)
+        seen = [p.pk for p in page]
+        while page.has_next():
+            page = cursor_paginate(products, ('date_added', 'id'), page.next_cursor, 2)
+            seen += [p.pk for p in page]
+        self.assertEqual(seen, [p.pk for p in reversed(self.products)])
+
+        page = cursor_paginate(products, ('date_added', 'id'), page.previous_cursor, 2)
+        self.assertEqual([p.pk for p in page], [self.products[2].pk, self.products[1].pk])
+
+    def test_tampered_cursors_give_the_first_page(self):
+        tokens = [
+            encode_cursor('next', ['abc', 'x']),
+            encode_cursor('next', [None, 1]),
+            encode_cursor('next', [[1], {}]),
+            encode_cursor('next', ['2020-01-01T00:00:00', 1]),
+            encode_cursor('next', [1]),
+            encode_cursor('sideways', ['2020-01-01T00:00:00+00:00', 1]),
+            'not a token',
+        ]
+        urls = [
+            reverse('home'),
+            reverse('ajax_reviews') + f'?product_id={self.products[0].pk}&',
+            reverse('api_products'),
+            reverse('api_reviews', args=[self.products[0].slug]),
+        ]
+        for token in tokens:
+            for url in urls:
+                with self.subTest(token=token, url=url):
+                    separator = '' if url.endswith('&') else '?'
+                    response = self.client.get(f'{url}{separator}cursor={token}')
+                    self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('api_products') + f'?cursor={tokens[0]}')
+        self.assertEqual(response.json()['results'][0]['slug'], self.products[-1].slug)
+
+
+class AssociationMiningTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Pens', slug='pens')
+        self.products = [Product.objects.create(
+            name=f'Pen {i}', price=10, description='', slug=f'pen-{i}', stock=5, category=category)
+            for i in range(5)]
+        self.user = User.objects.create(username='buyer')
+
+    def order(self, *indexes, date_ordered=None):
+        order = Order.objects.create(user=self.user, ordered=True, date_ordered=date_ordered or timezone.now())
+        for i in indexes:
+            order.items.add(CartProduct.objects.create(
+                user=self.user, item=self.products[i], ordered=True, in_cart=None))
+        return order
+
+    def recommendations(self):
+        return list(Recommendation.objects.order_by('product_id', 'rank').values_list(
+            'product_id', 'recommended_id', 'rank', 'support', 'confidence', 'lift'))
+
+    def test_incremental_runs_match_a_full_run(self):
+        started = timezone.now()
+        for basket in [(0, 1), (0, 1, 2), (1, 3), (2, 3, 4)]:
+            self.order(*basket)
+        self.assertEqual(mine_associations()[0], 4)
+
+        # Checked out before the first run's orders but committed after it.
+        self.order(0, 2, date_ordered=started)
+        for basket in [(0, 1, 3), (3, 4), (1, 2, 4)]:
+            self.order(*basket)
+        self.assertEqual(mine_associations(incremental=True)[0], 4)
+        self.assertEqual(mine_associations(incremental=True)[0], 0)
+        incremental = self.recommendations()
+
+        self.assertEqual(mine_associations()[0], 8)
+        self.assertEqual(self.recommendations(), incremental)
+
+    def test_engine_ranks_like_the_stored_recommendations(self):
+        # Pen 0's rules to Pen 2 and Pen 4 tie on support, confidence and lift.
+        for basket in [(0, 1), (0, 2), (0, 3), (0, 1, 4), (1, 2), (3, 4), (2, 4)]:
+            self.order(*basket)
+        mine_associations(top_k=3, min_lift=0.0)
+        engine = CooccurrenceEngine(min_lift=0.0).fit_orders()
+        for product in self.products:
+            stored = list(Recommendation.objects.filter(product=product).order_by('rank').values_list(
+                'recommended_id', flat=True))
+            self.assertEqual(engine.top_k(product.pk, 3), stored)
+        self.assertEqual(engine.top_k(self.products[0].pk, 3), [self.products[i].pk for i in (1, 3, 2)])
+        self.assertEqual(get_associated(self.products[0].pk), [self.products[1]])
+
+
+class RefundTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='buyer')
+        Balance.objects.create(user=self.user, balance=100)
+
+    def order(self):
+        return Order.objects.create(user=self.user, ordered=True, date_ordered=timezone.now(), total=30)
+
+    def accept(self, order, times=2):
+        for _ in range(times):
+            Refund.objects.create(order=order, reason='Broken', accepted=True)
+
+    def test_card_payment_is_not_credited_to_the_wallet(self):
+        order = self.order()
+        self.accept(order)
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 100)
+        self.assertFalse(LedgerEntry.objects.filter(kind=LedgerEntry.REFUND).exists())
+        order.refresh_from_db()
+        self.assertTrue(order.refund_granted)
+
+    def test_wallet_payment_is_credited_once(self):
+        order = self.order()
+        wallet.charge(order, 30)
+        self.accept(order)
+        refund = Refund.objects.create(order=order, reason='Again')
+        refund.accepted = True
+        refund.save()
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 100)
+        self.assertEqual(list(LedgerEntry.objects.filter(kind=LedgerEntry.REFUND).values_list('amount', flat=True)),
+                         [30])
+
+    def test_ledger_is_read_only_in_the_admin(self):
+        entry = wallet.top_up(self.user.pk, 10)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+        change = reverse('admin:store_ledgerentry_change', args=[entry.pk])
+        self.assertEqual(self.client.get(change).status_code, 200)
+        self.assertEqual(self.client.post(change, {'kind': 'topup', 'amount': 1000}).status_code, 403)
+        delete = reverse('admin:store_ledgerentry_delete', args=[entry.pk])
+        self.assertEqual(self.client.post(delete, {'post': 'yes'}).status_code, 403)
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 110)
+
+    def test_balances_change_only_through_the_ledger_in_the_admin(self):
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+        balance = Balance.objects.get(user=self.user)
+        change = reverse('admin:store_balance_change', args=[balance.pk])
+        self.assertEqual(self.client.post(change, {'user': self.user.pk, 'balance': 1000}).status_code, 403)
+
+        changelist = reverse('admin:store_balance_changelist')
+        form = self.client.post(changelist, {'action': 'top_up', '_selected_action': [balance.pk]})
+        self.assertContains(form, 'name="amount"')
+        self.client.post(changelist, {
+            'action': 'top_up', '_selected_action': [balance.pk], 'apply': '1', 'amount': '25'})
+        self.assertEqual(Balance.objects.get(user=self.user).balance, 125)
+        self.assertEqual(list(LedgerEntry.objects.values_list('kind', 'amount')), [(LedgerEntry.TOPUP, 25)])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Kırtasiye', slug='kirtasiye')
+        for i, (name, description) in enumerate([
+            ('İnce Kalem', ''), ('Kalın Uçlu', ''), ('Kalemlik', ''), ('Işıklı Defter', 'Kalem cepli'),
+            ('Çanta', ''), ('Şeker Boya', ''),
+        ]):
+            Product.objects.create(name=name, price=10, description=description, slug=f'product-{i}', stock=5,
+                                   category=self.category)
+        self.backend = InvertedIndexBackend()
+
+    def search(self, query):
+        return list(self.backend.search(query, Product.objects.all()).values_list('name', flat=True))
+
+    def test_turkish_letters_fold(self):
+        self.assertEqual(self.search('ince'), ['İnce Kalem'])
+        self.assertEqual(self.search('INCE'), ['İnce Kalem'])
+        self.assertEqual(self.search('ışıklı'), ['Işıklı Defter'])
+        self.assertEqual(self.search('isikli'), ['Işıklı Defter'])
+        self.assertEqual(self.search('canta'), ['Çanta'])
+        self.assertEqual(self.search('ŞEKER'), ['Şeker Boya'])
+
+    def test_terms_match_as_prefixes_and_all_have_to_match(self):
+        self.assertEqual(self.search('kal ince'), ['İnce Kalem'])
+        self.assertEqual(self.search('kalı'), ['Kalın Uçlu'])
+        self.assertEqual(self.search('kalem silgi'), [])
+
+    def test_names_and_exact_terms_rank_first(self):
+        # Name over description, the exact word over a longer one sharing it.
+        self.assertEqual(self.search('kalem'), ['İnce Kalem', 'Kalemlik', 'Işıklı Defter'])
+        self.assertEqual(self.search('kirtasiye defter'), ['Işıklı Defter'])
+
+    def test_saves_in_another_process_invalidate_the_index(self):
+        self.assertEqual(self.search('silgi'), [])
+        # The signal handler runs on the process-wide backend, this one only
+        # sees the shared version move.
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(name='Çanta')
+            product.name = 'Silgi'
+            product.save()
+        self.assertEqual(cache.get(InvertedIndexBackend.VERSION_KEY), 1)
+        self.assertEqual(self.search('silgi'), ['Silgi'])
+        self.assertEqual(self.search('canta'), [])
+
+    def test_mysql_boolean_query(self):
+        self.assertEqual(MySQLFullTextBackend().boolean_query('Kalem  defter!'), '+kalem* +defter*')
+        self.assertEqual(MySQLFullTextBackend().boolean_query('!!'), '')
+
+
+class ImageSrcsetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        os.makedirs(os.path.join(media.name, 'product_pic'))
+        Image.new('RGB', (500, 300), 'white').save(os.path.join(media.name, 'product_pic', 'pen.jpg'))
+
+    def test_variants_are_listed_with_their_real_width(self):
+        self.assertEqual(images.srcset('product_pic/pen.jpg'), '')
+        images.generate_derivatives('product_pic/pen.jpg')
+        self.assertEqual(images.srcset('product_pic/pen.jpg', 'webp'), ', '.join([
+            '/media/derivatives/product_pic/pen-160w.webp 160w',
+            '/media/derivatives/product_pic/pen-320w.webp 320w',
+            '/media/derivatives/product_pic/pen-640w.webp 500w',
+        ]))
+        # Recorded when generated, pages no longer look at the disk.
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'derivatives'))
+        self.assertEqual(len(images.srcset('product_pic/pen.jpg').split(', ')), 3)
+
+
+class CatalogTestCase(TestCase):
+    # One product and a buyer with a wallet, for the conditional GET tests.
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Pens', slug='pens')
+        self.product = Product.objects.create(
+            name='Pen', price=10, description='', slug='pen', stock=5, category=self.category)
+        self.user = User.objects.create(username='buyer')
+        Balance.objects.create(user=self.user, balance=100)
+
+    def change_catalog(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 12
+            self.product.save()
+
+
+class APIValidatorTest(CatalogTestCase):
+    def test_api_catalog_validators(self):
+        url = reverse('api_product', args=[self.product.slug])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['slug'], self.product.slug)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.change_catalog()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['price'], 12)
+
+    def test_api_cart_is_private(self):
+        self.assertEqual(self.client.get(reverse('api_cart')).status_code, 401)
+        self.client.force_login(self.user)
+        get_cart_store().add(self.user, self.product, 2)
+        response = self.client.get(reverse('api_cart'))
+        self.assertEqual(response.json()['count'], 1)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('api_cart'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        get_cart_store().add(self.user, self.product, 1)
+        self.assertEqual(self.client.get(reverse('api_cart'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ConditionalPageTest(CatalogTestCase):
+    def test_anonymous_pages_revalidate_until_the_catalog_changes(self):
+        for url in (reverse('home'), reverse('product', args=[self.product.slug])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+                self.assertEqual(
+                    self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        etag = self.client.get(reverse('home'))['ETag']
+        self.change_catalog()
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_pages_change_with_the_wallet_balance(self):
+        self.client.force_login(self.user)
+        # Sets the CSRF cookie, which is part of the tag too.
+        self.client.get(reverse('wallet'))
+        response = self.client.get(reverse('home'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        card = Card.objects.create(user=self.user, name='Card', cvc='000', expiry='01/30')
+        self.client.post(reverse('wallet'), {'savedcard': '', 'radio-button': card.pk, 'amount': '50'})
+        # Pages showing a flash message are never conditional, this one shows the top up's.
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '150.00')
+
+
+class LegacyOrderMigrationTest(TransactionTestCase):
+    # Checkout never set CartProduct.ordered before 0018, orders were only
+    # linked to their lines.
+    def migrate(self, *targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(list(targets))
+        executor.loader.build_graph()
+        return executor.loader.project_state(list(targets)).apps
+
+    def latest(self):
+        self.migrate(*MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def legacy_order(self, apps, in_cart_again=True):
+        user = apps.get_model('auth', 'User').objects.create(username='buyer')
+        category = apps.get_model('store', 'Category').objects.create(title='Pens', slug='pens')
+        Product = apps.get_model('store', 'Product')
+        pen = Product.objects.create(name='Pen', price=10, description='', slug='pen', category=category)
+        ink = Product.objects.create(name='Ink', price=5, discount_price=4, description='', slug='ink', category=category)
+        CartProduct = apps.get_model('store', 'CartProduct')
+        Order = apps.get_model('store', 'Order')
+        order = Order.objects.create(user=user, ordered=True, date_ordered=timezone.now())
+        order.items.add(CartProduct.objects.create(user=user, item=pen, quantity=2),
+                        CartProduct.objects.create(user=user, item=ink, quantity=1))
+        if in_cart_again:
+            cart = Order.objects.create(user=user, date_ordered=timezone.now())
+            cart.items.add(CartProduct.objects.create(user=user, item=pen, quantity=1))
+        return user.pk, order.pk
+
+    def assertRepaired(self, user_id, order_id, cart_lines):
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual(order.total, 24)
+        self.assertEqual(sorted(order.items.values_list('item__slug', 'unit_price', 'ordered', 'in_cart')),
+                         [('ink', 4, True, None), ('pen', 10, True, None)])
+        cart = get_cart_store().get_cart(User.objects.get(pk=user_id))
+        self.assertEqual([(line.item.slug, line.quantity) for line in cart], cart_lines)
+
+    def test_legacy_orders_get_closed_lines_and_totals(self):
+        user_id, order_id = self.legacy_order(self.migrate(('store', '0017_wallet_ledger')))
+        self.latest()
+        self.assertRepaired(user_id, order_id, [('pen', 1)])
+
+    def test_repair_of_databases_migrated_before_the_fix(self):
+        apps = self.migrate(('store', '0017_wallet_ledger'))
+        user_id, order_id = self.legacy_order(apps, in_cart_again=False)
+        apps = self.migrate(('store', '0021_product_updated_at'))
+        # What the earlier 0018 and 0019 left behind.
+        apps.get_model('store', 'CartProduct').objects.filter(order__pk=order_id).update(
+            ordered=False, in_cart=True, unit_price=None, total_price=None)
+        apps.get_model('store', 'Order').objects.filter(pk=order_id).update(total=0)
+        self.latest()
+        self.assertRepaired(user_id, order_id, [])
@@ -1,18 +1,37 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import get_object_or_404, render, redirect
 from django.views.generic import View
-from .models import CartProduct, Category, Product, Address, Order, Review, Card, Balance
+from .models import CartProduct, Category, Product, Address, Order, Review, Card, Balance, Recommendation, PurchasedProduct
 from .forms import AddressForm, ProductQuantityForm, ProductIDQuantityForm, ReviewForm, BalanceForm, ContactForm, RefundForm, CardForm
 from cities_light.models import SubRegion
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.views import redirect_to_login
 from django.utils import timezone
 from django.contrib import messages
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, Http404, JsonResponse
 from django.core.mail import send_mail, BadHeaderError
-from django.db.models import Q, Avg
-import decimal
-from .mba import get_associated
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from datetime import datetime
+from .bridge import run_sync
+from .cart import get_cart_store, NotAvailable
+from .caching import (
+    conditional_page, get_catalog_modified, get_catalog_version, get_or_render, get_stats, listing_key, page_etag,
+)
+from .checkout import checkout, CheckoutError, InsufficientBalance, OutOfStock
+from .leaderboards import get_best_rated
+from .listings import get_listing_page, get_listing_cursor_page, listing_products
+from .metrics import render_metrics
+from .pagination import cursor_paginate
+from .profiling import list_profiles
+from .search import search
+from .wallet import top_up
 
 class HomeView(View):
     def get(self, request, *args, **kwargs):
@@ -20,45 +39,127 @@ class HomeView(View):
             category_slug = kwargs['slug']
         else:
             category_slug = None
+        version = get_catalog_version()
+
+        if messages.get_messages(request):
+            return uncached(self.render_listing(request, category_slug, version))
+
+        etag = page_etag(request, 'listing', version)
+        if request.user.is_authenticated:
+            return conditional_page(request, etag, None,
+                                    lambda: self.render_listing(request, category_slug, version))
+
+        # Anonymous pages carry nothing personal, so whole pages are cached.
+        page = request.GET.get('cursor') or request.GET.get('page')
+        key = listing_key(version, category_slug, page, request.GET.get('q'))
+        return conditional_page(request, etag, get_catalog_modified(), lambda: HttpResponse(get_or_render(
+            'listing', key, lambda: self.render_listing(request, category_slug, version).content)))
+
+    def render_listing(self, request, category_slug, version):
         category = None
+        categories = list(Category.objects.all())
         if category_slug:
-            categories = Category.objects.all()
-            category = get_object_or_404(Category, slug=category_slug)
-            products = Product.objects.filter(category=category)
-        else:
-            categories = Category.objects.all()
-            products = Product.objects.all()
+            category = next((c for c in categories if c.slug == category_slug), None)
+            if category is None:
+                raise Http404("No Category matches the given query.")
+        products = listing_products(category)
 
         query = request.GET.get('q')
         if query:
-            products = products.filter(name__icontains=query)
-
-        page = request.GET.get('page', 1)
-
-        paginator = Paginator(products, 8)
-        try:
-            products = paginator.page(page)
-        except PageNotAnInteger:
-            products = paginator.page(1)
-        except EmptyPage:
-            products = paginator.page(paginator.num_pages)
+            # Search results are ranked, so they keep numbered pages.
+            products = get_listing_page(search(query, products), request.GET.get('page', 1))
+        elif settings.LISTING_PAGE_NUMBERS:
+            products = get_listing_page(products, request.GET.get('page', 1))
+        else:
+            products = get_listing_cursor_page(products, request.GET.get('cursor'))
 
         context = {
             'categories': categories,
             'category': category,
             'products': products,
+            'catalog_version': version,
         }
 
         return render(request, 'home.html', context)
 
 
+def uncached(response):
+    # Pages showing messages are personal and shown once.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class CacheStatsView(UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(get_stats())
+
+
+class MetricsView(UserPassesTestMixin, View):
+    raise_exception = True
+
+    def test_func(self):
+        token = settings.METRICS_TOKEN
+        if token and constant_time_compare(self.request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return True
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfilesView(View):
+    def get(self, request):
+        profiles = [{
+            'name': entry.name,
+            'size': entry.stat().st_size,
+            'modified': datetime.fromtimestamp(entry.stat().st_mtime),
+        } for entry in list_profiles()]
+        context = {
+            'profiles': profiles,
+            'title': 'Request profiles',
+            'site_header': admin.site.site_header,
+            'has_permission': True,
+        }
+        return render(request, 'admin/profiles.html', context)
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileDownloadView(View):
+    def get(self, request, name):
+        # Only names the listing offers, never a path.
+        entry = next((entry for entry in list_profiles() if entry.name == name), None)
+        if entry is None:
+            raise Http404()
+        return FileResponse(open(entry.path, 'rb'), as_attachment=True, filename=entry.name)
+
+
+def product_recommendations(product):
+    return Recommendation.objects.filter(product=product).select_related('recommended').order_by('rank')
+
+
 class ProductView(View):
     def get(self, request, *args, **kwargs):
         slug = kwargs['slug']
         product = get_object_or_404(Product, slug=slug)
+        purchased = PurchasedProduct.has_purchased(request.user, product)
+
+        if messages.get_messages(request):
+            return uncached(self.render_product(request, product, purchased))
+
+        # Stock is not part of the catalog version, updated_at moves with it.
+        etag = page_etag(request, 'product', get_catalog_version(), product.pk, product.available, purchased)
+        last_modified = max(product.updated_at, get_catalog_modified())
+        return conditional_page(request, etag, last_modified,
+                                lambda: self.render_product(request, product, purchased))
+
+    def render_product(self, request, product, purchased):
         reviews = Review.objects.filter(product=product)
 
-        rec_products = get_associated(product.id)
+        rec_products = [r.recommended for r in product_recommendations(product)]
 
         try:
             if request.user.is_authenticated:
@@ -68,38 +169,17 @@ class ProductView(View):
         except ObjectDoesNotExist:
             user_review = None
 
-        purchased = True
-        user_orders = Order.objects.filter(user=request.user, ordered=True)
-        if user_orders == None:
-            purchased = False
-        else:
-            for o in user_orders:
-                try:
-                    purchased_product = o.items.get(item=product)
-                    purchased = True 
-                    break              
-                except ObjectDoesNotExist:
-                    purchased = False
-
-        rating_percentages = []
-        for i in range(5,0,-1):
-            # rating_percentages.append(str(reviews.filter(rating=i).count()/review_count * 100) + "%")
-            rating_percentages.append((reviews.filter(rating=i).count()))
-        # form = ProductQuantityForm()
+        rating_percentages = product.get_rating_histogram()
 
         reviews = reviews.exclude(comment='').order_by('-updated_at')
 
-        paginator = Paginator(reviews, 3)
-
-        # Filter only get with more than 10 reviews but for this project not needed.
-        best_rated = Product.objects.filter(category=product.category).annotate(avg_score=Avg('review__rating')).order_by('-avg_score')[0:4]
+        best_rated = get_best_rated(product.category_id)
 
         context = {
             'object': product,
             'reviews': reviews,
             'percentages': rating_percentages,
             'user_review': user_review,
-            'page_count': paginator.num_pages,
             'best_rated': best_rated,
             'purchased': purchased,
             'rec_products': rec_products
@@ -109,8 +189,10 @@ class ProductView(View):
     def post(self, request, *args, **kwargs):
         slug = kwargs['slug']
         if 'submit-add' in request.POST:
+            if not request.user.is_authenticated:
+                return redirect('login')
             form = ProductQuantityForm(request.POST)
-            item = get_object_or_404(Product, slug=slug)
+            item = get_object_or_404(Product.objects.only('stock'), slug=slug)
             quantity = int(form.data['quantity'])
 
             if quantity > item.stock:
@@ -121,61 +203,42 @@ class ProductView(View):
                 messages.error(request, 'Choose a valid amount.')
                 return redirect('product', slug=slug)
 
-            order_item, created = CartProduct.objects.get_or_create(
-                item=item,
-                user=request.user,
-                ordered=False
-            )
-
-            order_qs = Order.objects.filter(user=request.user, ordered=False)
-            if order_qs.exists():
-                order = order_qs[0]
-                # check if the order item is in the order
-                if order.items.filter(item__slug=item.slug).exists():
-                    if (order_item.quantity + quantity) > item.stock:
-                        messages.error(request, 'You already have this item in cart. Total quantity exceeds stock.')
-                        return redirect('product', slug=slug)
-
-                    order_item.quantity += quantity
-                    order_item.save()
-                else:
-                    order_item.quantity = quantity
-                    order_item.save()
-                    order.items.add(order_item)
+            try:
+                created, capped = get_cart_store().add(request.user, item, quantity)
+            except NotAvailable:
+                messages.error(request, 'Not enough of this item is available right now.')
+                return redirect('product', slug=slug)
+
+            if created:
+                request.session['items_total'] = request.session.get('items_total', 0) + 1
+            if capped:
+                messages.error(request, 'You already have this item in cart. Total quantity exceeds stock, your cart now has all of it.')
             else:
-                ordered_date = timezone.now()
-                order = Order.objects.create(
-                    user=request.user, date_ordered=ordered_date)
-                order_item.quantity = quantity
-                order.items.add(order_item)
-            request.session['items_total'] = order.items.count()
-            messages.success(request, 'Item added to cart.')
+                messages.success(request, 'Item added to cart.')
             return redirect('product', slug=slug)
         else:   #Review part
             user = request.user
             item = get_object_or_404(Product, slug=slug)
-            review, created = Review.objects.get_or_create(
-                product=item,
-                user=request.user,
-            )
-            review.updated_at = timezone.now()
-            form = ReviewForm(request.POST,instance=review)
-            form.save()
+            with transaction.atomic():
+                review, created = Review.objects.get_or_create(
+                    product=item,
+                    user=request.user,
+                )
+                review.updated_at = timezone.now()
+                form = ReviewForm(request.POST,instance=review)
+                form.save()
             
             return redirect('product', slug=slug)
 
 class CartView(LoginRequiredMixin, View):
     def get(self, request):
-        user = request.user
-        try:
-            order = Order.objects.get(user=user, ordered=False)
-            request.session['items_total'] = order.items.count()
-        except ObjectDoesNotExist:
-            order = None
-            request.session['items_total'] = 0
+        cart = get_cart_store().get_cart(request.user)
+        # Assigning marks the session modified, which costs a write.
+        if request.session.get('items_total') != cart.count():
+            request.session['items_total'] = cart.count()
 
         context = {
-            'order' : order,
+            'cart' : cart,
         }
         
         return render(request, 'cart.html', context)
@@ -183,20 +246,19 @@ class CartView(LoginRequiredMixin, View):
     def post(self, request):
         
         form = ProductIDQuantityForm(request.POST)
-        cartproduct_id = int(form.data['product_id'])
+        product_id = int(form.data['product_id'])
         quantity = int(form.data['quantity'])
-        cart_product = get_object_or_404(CartProduct, id=cartproduct_id)
-        print(cart_product)
+        product = get_object_or_404(Product.objects.only('name', 'stock'), id=product_id)
+        cart_store = get_cart_store()
 
         if request.POST.get('delete'):
-            print(cartproduct_id)
-            cart_product.delete()
-            messages.success(request, f'{cart_product.item.name} successfully deleted from cart.')
-            request.session['items_total'] -= 1
+            cart_store.remove(request.user, product)
+            messages.success(request, f'{product.name} successfully deleted from cart.')
+            request.session['items_total'] = cart_store.count(request.user)
             return redirect('cart')
 
         elif request.POST.get('change'):
-            if quantity > cart_product.item.stock:
+            if quantity > product.stock:
                 messages.error(request, 'Chosen quantity exceeds stock.')
                 return redirect('cart')
 
@@ -204,10 +266,13 @@ class CartView(LoginRequiredMixin, View):
                 messages.error(request, 'Choose a valid amount.')
                 return redirect('cart')
 
-            cart_product.quantity = quantity
-            cart_product.save()
+            try:
+                cart_store.set_quantity(request.user, product, quantity)
+            except NotAvailable:
+                messages.error(request, f'Not enough {product.name} is available right now.')
+                return redirect('cart')
 
-            messages.success(request, f'Quantity of {cart_product.item.name} successfully changed.')
+            messages.success(request, f'Quantity of {product.name} successfully changed.')
             return redirect('cart')
 
 
@@ -246,6 +311,13 @@ class LoadSubregionsView(LoginRequiredMixin, View):
         subregions = SubRegion.objects.filter(region_id=region_id)
         return render(request, 'ajax_form/subregion_dropdown_list.html', { 'subregions': subregions})
 
+async def load_subregions(request):
+    # LoadSubregionsView for ASGI, see ASYNC_AJAX.
+    if not await run_sync(lambda: request.user.is_authenticated):
+        return redirect_to_login(request.get_full_path())
+    subregions = SubRegion.objects.filter(region_id=request.GET.get('region_id'))
+    return render(request, 'ajax_form/subregion_dropdown_list.html', {'subregions': await run_sync(list, subregions)})
+
 class ContactView(View):
     def get(self, request, *args, **kwargs):
         form = ContactForm()
@@ -268,46 +340,45 @@ class ContactView(View):
                 return HttpResponse('Invalid header found.')
             return redirect ("contact")
 
+REVIEWS_PER_PAGE = 3
+REVIEW_ORDER = ('updated_at', 'id')
+
+
+def product_reviews(product_id):
+    return Review.objects.filter(product_id=product_id).exclude(comment='').select_related('user')
+
+
 class AjaxReviewsView(View):
     def get(self, request):
-        pageNo = int(request.GET.get('page'))
+        cursor = request.GET.get('cursor')
         product_id = request.GET.get('product_id')
-        pageSize = 3
 
-        starting_number = (pageNo - 1) * pageSize
-        ending_number = pageNo * pageSize
-
-        reviews = Review.objects.filter(product_id=product_id).exclude(comment='').order_by('-updated_at')[starting_number:ending_number]
+        reviews = cursor_paginate(product_reviews(product_id), REVIEW_ORDER, cursor, REVIEWS_PER_PAGE)
 
         return render(request, 'ajax_reviews.html', { 'reviews': reviews})
-            
 
-class CheckoutView(LoginRequiredMixin, View):
-    def order_checkout(self, request, order, address):
-        products = order.items.all()
-        for product in products:
-            if product.quantity > product.item.stock:
-                return product.item
-
-        for product in products:
-            product.item.stock -= product.quantity
-            product.item.save()
-        order.ordered = True
-        order.shipping_address = address
-        order.save()
-        request.session['items_total'] = 0
-        return "success"
 
+async def ajax_reviews(request):
+    # AjaxReviewsView for ASGI, see ASYNC_AJAX. Only the query leaves the
+    # event loop, the page is rendered from the fetched rows.
+    reviews = product_reviews(request.GET.get('product_id'))
+    reviews = await run_sync(cursor_paginate, reviews, REVIEW_ORDER, request.GET.get('cursor'), REVIEWS_PER_PAGE)
+    return render(request, 'ajax_reviews.html', {'reviews': reviews})
+
+
+class CheckoutView(LoginRequiredMixin, View):
     def get(self, request):
 
-        order = Order.objects.get(user=request.user, ordered=False)
-        adresses = Address.objects.filter(user=request.user)
+        cart = get_cart_store().get_cart(request.user)
+        if not cart:
+            return redirect('cart')
+        adresses = Address.objects.filter(user=request.user).select_related('region', 'subregion')
         cards = Card.objects.filter(user=request.user)
         wallet = Balance.objects.get(user=request.user)
 
-        balance_left = round(float(wallet.balance) - order.get_total(),2)
+        balance_left = round(float(wallet.balance) - cart.get_total(),2)
         context = {
-            'order' : order,
+            'cart' : cart,
             'addresses': adresses,
             'cards': cards,
             'wallet': wallet,
@@ -317,7 +388,6 @@ class CheckoutView(LoginRequiredMixin, View):
 
     def post(self, request):
         address_id = request.POST.get('address')
-        order = Order.objects.get(user=request.user, ordered=False)
         user = request.user
 
         if 'newcard' in request.POST:
@@ -342,34 +412,49 @@ class CheckoutView(LoginRequiredMixin, View):
             Card.objects.get(id=card_id).delete()
             messages.success(request, "Successfully deleted card.")
             return redirect('checkout')
-        else:
-            wallet = Balance.objects.get(user=user)
-            order_total = order.get_total()
-            if wallet.balance < order_total:
-                messages.error(request, "Insufficient balance.")
-                return redirect('checkout')
-
-            wallet.balance = decimal.Decimal(str(round(float(wallet.balance) - order_total,2)))
-            wallet.save()
-            self.request.session['balance'] = str(wallet.balance)
+        pay_with_wallet = not ('newcard' in request.POST or 'savedcard' in request.POST)
 
         address_id = int(request.POST.get('address'))
         address = Address.objects.get(id=address_id)
-        stat = self.order_checkout( request, order, address)
-        if not isinstance(stat, str):
-            messages.error(request, f"Quantity of {stat.name} exceeds stock, please review your cart.")
+        cart_store = get_cart_store()
+        order = cart_store.get_order(user)
+        if order is None:
+            return redirect('cart')
+        try:
+            checkout(order, address, pay_with_wallet)
+        except OutOfStock as e:
+            messages.error(request, f"Quantity of {e} exceeds stock, please review your cart.")
             return redirect('checkout')
-        else:
-            messages.success(request, "Successfully ordered.")
-            return redirect('home')
+        except InsufficientBalance:
+            messages.error(request, "Insufficient balance.")
+            return redirect('checkout')
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('checkout')
+
+        if pay_with_wallet:
+            self.request.session['balance'] = str(Balance.objects.get(user=user).balance)
+        cart_store.clear(user)
+        request.session['items_total'] = 0
+        messages.success(request, "Successfully ordered.")
+        return redirect('home')
+
 
-        return redirect('checkout')
 
+ORDER_HISTORY_ORDER = ('date_ordered', 'id')
+ORDERS_PER_PAGE = 10
+
+
+def order_history(user):
+    return Order.objects.filter(user=user, ordered=True).select_related(
+        'shipping_address__region', 'shipping_address__subregion',
+    ).prefetch_related(Prefetch('items', queryset=CartProduct.objects.select_related('item')))
 
 
 class OrdersView(LoginRequiredMixin, View):
     def get(self, request):
-        orders = Order.objects.filter(user=request.user, ordered=True)
+        orders = cursor_paginate(order_history(request.user), ORDER_HISTORY_ORDER, request.GET.get('cursor'),
+                                 ORDERS_PER_PAGE)
         context = {
             'orders': orders
         }
@@ -379,7 +464,8 @@ class RefundView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         pk = kwargs['pk']
         form = RefundForm()
-        order = get_object_or_404(Order, pk=pk)
+        order = get_object_or_404(Order.objects.prefetch_related(
+            Prefetch('items', queryset=CartProduct.objects.select_related('item__category'))), pk=pk)
         return render(request, 'refund.html', {'form': form, 'order': order})
 
     def post(self, request, *args, **kwargs):
@@ -432,21 +518,21 @@ class BalanceView(LoginRequiredMixin, View):
             messages.success(request, "Successfully deleted card.")
             return redirect('wallet')
 
-        wallet = Balance.objects.get(user=user)
         balance_form = BalanceForm(request.POST)
         if balance_form.is_valid() and valid:
-            wallet.balance += balance_form.cleaned_data['amount']
-            wallet.balance = decimal.Decimal(str(round(float(wallet.balance),2)))
+            with transaction.atomic():
+                top_up(user.id, balance_form.cleaned_data['amount'])
 
-            if 'newcard' and 'save' in request.POST:
-                    card = form.save(commit=False)
-                    card.user = request.user
-                    card.save()
+                if 'newcard' and 'save' in request.POST:
+                        card = form.save(commit=False)
+                        card.user = request.user
+                        card.save()
 
-            wallet.save()
-            self.request.session['balance'] = str(wallet.balance)
             messages.success(request, "Successfully loaded balance.")
 
+        wallet = Balance.objects.get(user=user)
+        self.request.session['balance'] = str(wallet.balance)
+
 
         cards = Card.objects.filter(user=request.user)
         context = {
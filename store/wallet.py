@@ -0,0 +1,136 @@
+import decimal
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import Balance, BalanceSnapshot, LedgerEntry, Order
+
+CENT = decimal.Decimal('0.01')
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def post(user_id, kind, amount, **links):
+    # The balance changes in the same transaction as the ledger row that
+    # explains it. Debits only go through while the balance covers them.
+    amount = decimal.Decimal(amount).quantize(CENT)
+    with transaction.atomic():
+        balances = Balance.objects.filter(user=user_id)
+        if amount < 0:
+            balances = balances.filter(balance__gte=-amount)
+        if not balances.update(balance=F('balance') + amount):
+            if amount < 0:
+                raise InsufficientBalance()
+            raise Balance.DoesNotExist()
+        return LedgerEntry.objects.create(user_id=user_id, kind=kind, amount=amount, **links)
+
+
+def top_up(user_id, amount):
+    if amount <= 0:
+        raise ValueError('Top ups have to be positive.')
+    return post(user_id, LedgerEntry.TOPUP, amount)
+
+
+def charge(order, amount):
+    return post(order.user_id, LedgerEntry.PURCHASE, -amount, order=order)
+
+
+def credit_refund(refund):
+    # Gives back what the wallet paid for the order, once per order however
+    # many refunds get accepted. Card payments never reached the wallet, so
+    # their refund is only marked as granted.
+    with transaction.atomic():
+        # A second refund of the same order waits here and then finds it granted.
+        granted = Order.objects.select_for_update().filter(pk=refund.order_id).values_list(
+            'refund_granted', flat=True).first()
+        entries = LedgerEntry.objects.filter(order=refund.order_id)
+        if granted is not False or entries.filter(kind=LedgerEntry.REFUND).exists():
+            return None
+        paid = -(entries.filter(kind=LedgerEntry.PURCHASE).aggregate(total=Sum('amount'))['total'] or 0)
+        entry = None
+        if paid > 0:
+            entry = post(refund.order.user_id, LedgerEntry.REFUND, paid, order_id=refund.order_id, refund=refund)
+        Order.objects.filter(pk=refund.order_id).update(refund_granted=True)
+    return entry
+
+
+def get_balance(user_id):
+    return Balance.objects.filter(user=user_id).values_list('balance', flat=True).first()
+
+
+def user_batches(batch_size):
+    last = 0
+    while True:
+        users = list(Balance.objects.filter(user_id__gt=last).order_by('user_id').values_list(
+            'user_id', flat=True)[:batch_size])
+        if not users:
+            return
+        yield users
+        last = users[-1]
+
+
+def locked_batch(users):
+    # Posting updates the balance row before writing its entry, so while these
+    # rows are locked every entry of these users is committed and no new one
+    # can start.
+    balances = dict(Balance.objects.select_for_update().filter(user__in=users).order_by(
+        'user_id').values_list('user_id', 'balance'))
+    snapshots = BalanceSnapshot.objects.in_bulk(users, field_name='user_id')
+    since = {}
+    for user_id in users:
+        snapshot = snapshots.get(user_id)
+        since[user_id] = snapshot.last_entry_id if snapshot else 0
+
+    pending = {}
+    rows = LedgerEntry.objects.filter(user__in=users, id__gt=min(since.values())).values_list(
+        'user_id', 'id', 'amount').order_by()
+    for user_id, entry_id, amount in rows.iterator():
+        if entry_id > since[user_id]:
+            total, last = pending.get(user_id, (0, 0))
+            pending[user_id] = (total + amount, max(last, entry_id))
+    return balances, snapshots, pending
+
+
+def take_snapshots(batch_size=1000):
+    taken = 0
+    for users in user_batches(batch_size):
+        with transaction.atomic():
+            balances, snapshots, pending = locked_batch(users)
+            now = timezone.now()
+            changed, created = [], []
+            for user_id, (total, last) in pending.items():
+                snapshot = snapshots.get(user_id)
+                if snapshot is None:
+                    created.append(BalanceSnapshot(user_id=user_id, balance=total, last_entry_id=last, taken_at=now))
+                else:
+                    snapshot.balance += total
+                    snapshot.last_entry_id = last
+                    snapshot.taken_at = now
+                    changed.append(snapshot)
+            BalanceSnapshot.objects.bulk_create(created)
+            BalanceSnapshot.objects.bulk_update(changed, ['balance', 'last_entry_id', 'taken_at'])
+            taken += len(created) + len(changed)
+    return taken
+
+
+def reconcile(batch_size=1000, full=False):
+    # Yields (user_id, balance, ledger balance) for every wallet that does not
+    # match its snapshot plus the newer entries. With `full` the snapshots
+    # themselves are checked against the whole ledger too.
+    for users in user_batches(batch_size):
+        with transaction.atomic():
+            balances, snapshots, pending = locked_batch(users)
+            if full:
+                sums = dict(LedgerEntry.objects.filter(user__in=users).order_by().values('user_id').annotate(
+                    total=Sum('amount')).values_list('user_id', 'total'))
+        for user_id, balance in balances.items():
+            snapshot = snapshots.get(user_id)
+            expected = (snapshot.balance if snapshot else 0) + pending.get(user_id, (0, 0))[0]
+            if full:
+                expected_full = sums.get(user_id) or 0
+                if expected_full != expected:
+                    yield user_id, balance, expected_full
+                    continue
+            if balance != expected:
+                yield user_id, balance, expected